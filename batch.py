@@ -0,0 +1,192 @@
+"""Resolve em lote os tabuleiros de PipeMania de uma ou mais pastas ou
+padrões glob, numa pool de processos, escrevendo cada solução ao lado do
+respetivo tabuleiro.
+
+Por exemplo:
+    $ python3 batch.py test_1-9 'test_10x10-50x50/*.txt' --workers 4
+
+Por cada tabuleiro é escrita uma linha com o ficheiro, o resultado e os
+tempos (em segundos) de leitura e de procura.
+
+Com --shared-memory, os tabuleiros são lidos por este processo e passados
+aos processos da pool num segmento de memória partilhada (ver
+sharedboards), onde são também escritas as soluções.
+"""
+
+import argparse
+import glob
+import multiprocessing
+import os
+import pstats
+import sys
+import tempfile
+import time
+
+import profiling
+from pipe import Board, engines, solve
+from sharedboards import SharedBoards
+
+# Boards of the batch, when they are passed in shared memory
+shared_boards = None
+
+
+def find_puzzles(patterns, suffix: str = ".txt") -> list:
+    """Devolve os ficheiros das pastas (os que têm o sufixo indicado) ou
+    padrões glob indicados."""
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, "*" + suffix)
+        paths.extend(sorted(glob.glob(pattern)))
+    return paths
+
+
+def solve_file(path: str, engine: str = "cbj", suffix: str = ".out") -> tuple:
+    """Resolve o tabuleiro do ficheiro e escreve a solução num ficheiro com
+    o mesmo nome e o sufixo indicado. Devolve (ficheiro, resultado, tempo
+    de leitura, tempo de procura)."""
+    start = time.perf_counter()
+    try:
+        with open(path) as file:
+            board = Board.parse_lines(file)
+        parsed = time.perf_counter()
+        solution = solve(board, engine)
+    except Exception as error:
+        return path, f"error: {error!r}", time.perf_counter() - start, 0.0
+    solved = time.perf_counter()
+
+    if solution is None:
+        return path, "unsolved", parsed - start, solved - parsed
+
+    with open(os.path.splitext(path)[0] + suffix, "w") as file:
+        file.write(f"{solution}\n")
+    return path, "solved", parsed - start, solved - parsed
+
+
+def solve_shared(path: str, slot: tuple, engine: str = "cbj") -> tuple:
+    """Resolve o tabuleiro guardado no lugar slot de shared_boards e
+    escreve aí a solução. Devolve o mesmo que solve_file; a leitura é só
+    o cálculo do estado inicial."""
+    start = time.perf_counter()
+    try:
+        board = shared_boards.read(slot)
+        parsed = time.perf_counter()
+        solution = solve(board, engine)
+    except Exception as error:
+        return path, f"error: {error!r}", time.perf_counter() - start, 0.0
+    solved = time.perf_counter()
+
+    if solution is None:
+        return path, "unsolved", parsed - start, solved - parsed
+    shared_boards.write(slot, solution)
+    return path, "solved", parsed - start, solved - parsed
+
+
+def init_shared(name: str):
+    """Prepara um processo da pool para ler os tabuleiros do segmento."""
+    global shared_boards
+    shared_boards = SharedBoards.attach(name)
+
+
+def solve_task(task: tuple) -> tuple:
+    """Resolve um tabuleiro numa pool, do seu ficheiro ou, se for dado o
+    seu lugar, de shared_boards. Devolve o resultado de solve_file e, se
+    for pedido o perfil, o ficheiro temporário com o perfil da resolução
+    (ou None)."""
+    path, engine, suffix, profile, slot = task
+    if slot is None:
+        function, args = solve_file, (path, engine, suffix)
+    else:
+        function, args = solve_shared, (path, slot, engine)
+    if not profile:
+        return function(*args), None
+
+    result, stats = profiling.profile_call(function, *args)
+    handle, stats_path = tempfile.mkstemp(suffix=".pstats")
+    os.close(handle)
+    stats.dump_stats(stats_path)
+    return result, stats_path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Resolve em lote tabuleiros de PipeMania.")
+    parser.add_argument("patterns", nargs="+",
+                        help="pastas ou padrões glob com os tabuleiros (.txt)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="número de processos (por omissão, um por CPU)")
+    parser.add_argument("--engine", choices=engines, default="cbj",
+                        help="procura a usar (por omissão, cbj)")
+    parser.add_argument("--suffix", default=".out",
+                        help="sufixo dos ficheiros com as soluções (por omissão, .out)")
+    parser.add_argument("--profile", nargs="?", const="batch", metavar="PREFIX",
+                        help="resolve com o cProfile e guarda o perfil conjunto em "
+                             "PREFIX.pstats e PREFIX.collapsed (por omissão, PREFIX é batch)")
+    parser.add_argument("--shared-memory", action="store_true",
+                        help="lê os tabuleiros neste processo e passa-os à pool, e recebe "
+                             "as soluções, num segmento de memória partilhada")
+    args = parser.parse_args(argv)
+
+    paths = find_puzzles(args.patterns)
+    start = time.perf_counter()
+    failed = 0
+    slots = {}
+    global shared_boards
+    if args.shared_memory:
+        read_paths, boards = [], []
+        for path in paths:
+            try:
+                with open(path) as file:
+                    boards.append(Board.read_cells(file))
+            except Exception as error:
+                print(f"{path}\terror: {error!r}\t0.000000\t0.000000", flush=True)
+                failed += 1
+                continue
+            read_paths.append(path)
+        shared_boards, board_slots = SharedBoards.create(boards)
+        slots = dict(zip(read_paths, board_slots))
+    tasks = [(path, args.engine, args.suffix, args.profile, slots.get(path)) for path in paths
+             if path in slots or not args.shared_memory]
+
+    if args.workers == 1:
+        results = map(solve_task, tasks)
+        pool = None
+    elif args.shared_memory:
+        pool = multiprocessing.Pool(args.workers, initializer=init_shared,
+                                    initargs=(shared_boards.name,))
+        results = pool.imap_unordered(solve_task, tasks)
+    else:
+        pool = multiprocessing.Pool(args.workers)
+        results = pool.imap_unordered(solve_task, tasks)
+
+    profile = None
+    for (path, status, parse_time, solve_time), stats_path in results:
+        print(f"{path}\t{status}\t{parse_time:.6f}\t{solve_time:.6f}", flush=True)
+        failed += status != "solved"
+        if status == "solved" and path in slots:
+            with open(os.path.splitext(path)[0] + args.suffix, "w") as file:
+                file.write(f"{shared_boards.format(slots[path])}\n")
+        if stats_path is not None:
+            if profile is None:
+                profile = pstats.Stats(stats_path)
+            else:
+                profile.add(stats_path)
+            os.remove(stats_path)
+
+    if pool is not None:
+        pool.close()
+        pool.join()
+    if shared_boards is not None:
+        shared_boards.close()
+        shared_boards.unlink()
+
+    elapsed = time.perf_counter() - start
+    if profile is not None:
+        profiling.write_profile(profile, args.profile)
+    print(f"{len(paths)} puzzles in {elapsed:.3f}s "
+          f"({len(paths) / elapsed if elapsed else 0:.1f}/s), {failed} failed",
+          file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
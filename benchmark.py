@@ -0,0 +1,296 @@
+"""Medições de desempenho do resolvedor de PipeMania.
+
+    $ python3 benchmark.py run --repeat 5 --output baseline.json
+    $ python3 benchmark.py run --repeat 5 --output current.json
+    $ python3 benchmark.py compare baseline.json current.json
+    $ python3 benchmark.py startup --repeat 20
+
+O comando run resolve no próprio processo cada tabuleiro das pastas de
+testes, várias vezes, e guarda em JSON os tempos de cada execução, os nós
+expandidos, as revisões de domínios feitas pela propagação e o pico de
+memória. Os contadores e a memória são medidos numa execução à parte, para
+não afetarem os tempos. O comando compare indica os tabuleiros em que os
+tempos pioraram de forma estatisticamente significativa (teste de
+Mann-Whitney) em relação a uma execução anterior.
+
+O comando startup corre o resolvedor num tabuleiro pequeno com
+`python -X importtime` e mostra a mediana do tempo total do processo e do
+tempo de importação de cada módulo de topo.
+"""
+
+import argparse
+import datetime
+import gc
+import json
+import math
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from batch import find_puzzles
+from pipe import Board, PipeMania, SolverStats, engines
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SOLVER = os.path.join(HERE, "pipe.py")
+SMALL_BOARD = os.path.join(HERE, "test_1-9", "test-01.txt")
+TEST_DIRS = ["test_1-9", "test_10x10-50x50"]
+
+
+def read_board(path: str, stats: SolverStats = None) -> Board:
+    with open(path) as file:
+        return Board.parse_lines(file, stats)
+
+
+def time_solve(path: str, engine: str) -> tuple:
+    """Lê e resolve o tabuleiro. Devolve o tempo gasto, em segundos, e o
+    tabuleiro resolvido (ou None)."""
+    gc.collect()
+    start = time.perf_counter()
+    goal_node = engines[engine](PipeMania(read_board(path)))
+    elapsed = time.perf_counter() - start
+    return elapsed, goal_node.state.board if goal_node else None
+
+
+def count_solve(path: str, engine: str) -> dict:
+    """Resolve o tabuleiro com os contadores ligados. Devolve os contadores
+    de SolverStats e o pico de memória, em bytes."""
+    stats = SolverStats()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        engines[engine](PipeMania(read_board(path, stats), stats=stats))
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    counters = stats.as_dict()
+    for name in ("parse_time", "search_time", "output_time"):
+        del counters[name]
+    # Domain revisions made by propagation
+    counters["propagations"] = counters.pop("actions_for_cell")
+    counters["peak_memory"] = peak
+    return counters
+
+
+def run(args):
+    paths = find_puzzles(args.patterns or [os.path.join(HERE, name) for name in TEST_DIRS])
+    puzzles = {}
+    for path in paths:
+        name = os.path.relpath(path, HERE)
+        times = []
+        for _ in range(args.repeat):
+            elapsed, solution = time_solve(path, args.engine)
+            times.append(elapsed)
+
+        expected = os.path.splitext(path)[0] + ".out"
+        if solution is None:
+            status = "unsolved"
+        elif os.path.exists(expected):
+            with open(expected) as file:
+                status = "solved" if file.read().strip() == str(solution) else "wrong"
+        else:
+            status = "solved"
+
+        result = {"status": status, "times": times, "median": statistics.median(times)}
+        result.update(count_solve(path, args.engine))
+        puzzles[name] = result
+        print(f"{name}\t{status}\t{result['median'] * 1000:.2f}ms\t"
+              f"{result['nodes_expanded']} nodes\t{result['propagations']} propagations\t"
+              f"{result['peak_memory'] / 1024:.0f}KiB", flush=True)
+
+    report = {
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "engine": args.engine,
+        "repeat": args.repeat,
+        "puzzles": puzzles,
+    }
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+    return 0 if all(result["status"] == "solved" for result in puzzles.values()) else 1
+
+
+def mann_whitney(x: list, y: list) -> float:
+    """Devolve o valor p bilateral do teste de Mann-Whitney para as amostras
+    x e y. Sem empates e com amostras pequenas a distribuição de U é exata;
+    caso contrário usa-se a aproximação normal com correção para empates."""
+    n, m = len(x), len(y)
+    ranked = sorted([(value, 0) for value in x] + [(value, 1) for value in y])
+    ranks = [0.0] * len(ranked)
+    ties = []
+    i = 0
+    while i < len(ranked):
+        j = i
+        while j + 1 < len(ranked) and ranked[j + 1][0] == ranked[i][0]:
+            j += 1
+        for k in range(i, j + 1):
+            ranks[k] = (i + j) / 2 + 1
+        ties.append(j - i + 1)
+        i = j + 1
+
+    rank_sum = sum(rank for rank, (_, sample) in zip(ranks, ranked) if sample == 0)
+    u = rank_sum - n * (n + 1) / 2
+    u = min(u, n * m - u)
+
+    if max(ties) == 1 and n + m <= 40:
+        # counts[a][b][k]: arrangements of a and b values in which U is k
+        counts = [[None] * (m + 1) for _ in range(n + 1)]
+        for a in range(n + 1):
+            for b in range(m + 1):
+                if a == 0 or b == 0:
+                    counts[a][b] = [1] + [0] * (a * b)
+                    continue
+                # The largest value belongs either to x (beating every y) or to y
+                counts[a][b] = [(counts[a - 1][b][k - b] if k >= b and k - b <= (a - 1) * b else 0)
+                                + (counts[a][b - 1][k] if k <= a * (b - 1) else 0)
+                                for k in range(a * b + 1)]
+        p = 2 * sum(counts[n][m][:int(u) + 1]) / math.comb(n + m, n)
+        return min(1.0, p)
+
+    total = n + m
+    mean = n * m / 2
+    variance = n * m / 12 * ((total + 1) - sum(t ** 3 - t for t in ties) / (total * (total - 1)))
+    if variance == 0:
+        return 1.0
+    z = (abs(u - mean) - 0.5) / math.sqrt(variance)
+    return min(1.0, math.erfc(max(z, 0.0) / math.sqrt(2)))
+
+
+def compare(args):
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    with open(args.current) as file:
+        current = json.load(file)
+
+    regressions = 0
+    for name, result in current["puzzles"].items():
+        old = baseline["puzzles"].get(name)
+        if old is None:
+            continue
+        ratio = result["median"] / old["median"] if old["median"] else math.inf
+        p = mann_whitney(old["times"], result["times"])
+        if p < args.alpha and ratio > 1 + args.threshold:
+            verdict = "REGRESSION"
+            regressions += 1
+        elif p < args.alpha and ratio < 1 - args.threshold:
+            verdict = "improvement"
+        else:
+            verdict = ""
+        print(f"{name}\t{old['median'] * 1000:.2f}ms\t{result['median'] * 1000:.2f}ms\t"
+              f"{ratio:.3f}x\tp={p:.4f}\t{verdict}".rstrip())
+        if result.get("status") != old.get("status"):
+            print(f"{name}: status changed from {old.get('status')} to {result.get('status')}")
+            regressions += 1
+
+    print(f"{regressions} regressions", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+def parse_importtime(stderr: str) -> tuple:
+    """Lê o relatório de `-X importtime`. Devolve o tempo cumulativo (em
+    microssegundos) de cada módulo importado diretamente pelo programa e
+    o conjunto de todos os módulos importados, a qualquer profundidade."""
+    modules = {}
+    imported = set()
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        imported.add(name.strip())
+        # Nested imports are indented under the module that imported them
+        if not name.startswith("  "):
+            modules[name.strip()] = int(cumulative)
+    return modules, imported
+
+
+def measure_startup(board: str = SMALL_BOARD) -> tuple:
+    """Corre o resolvedor uma vez no tabuleiro indicado. Devolve o tempo
+    total do processo, em segundos, os tempos de importação e os módulos
+    importados (ver parse_importtime)."""
+    with open(board) as file:
+        start = time.perf_counter()
+        process = subprocess.run([sys.executable, "-X", "importtime", SOLVER],
+                                 stdin=file, capture_output=True, text=True, check=True)
+        elapsed = time.perf_counter() - start
+    return (elapsed, *parse_importtime(process.stderr))
+
+
+def startup(args):
+    wall_times = []
+    import_times = {}
+    imported = set()
+    for _ in range(args.repeat):
+        elapsed, modules, run_imported = measure_startup(args.board)
+        wall_times.append(elapsed)
+        imported |= run_imported
+        for name, cumulative in modules.items():
+            import_times.setdefault(name, []).append(cumulative)
+
+    report = {
+        "board": args.board,
+        "repeat": args.repeat,
+        "wall_time": statistics.median(wall_times),
+        "imports": {name: statistics.median(times) / 1e6
+                    for name, times in import_times.items()},
+    }
+
+    print(f"process\t{report['wall_time'] * 1000:.1f}ms")
+    slowest = sorted(report["imports"].items(), key=lambda item: item[1], reverse=True)
+    for name, seconds in slowest[:args.top]:
+        print(f"{name}\t{seconds * 1000:.1f}ms")
+    if any(name == "numpy" or name.startswith("numpy.") for name in imported):
+        print("warning: numpy is imported on the solver path", file=sys.stderr)
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(report, file, indent=2)
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Medições de desempenho do resolvedor de PipeMania.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="mede os tempos de resolução dos tabuleiros")
+    run_parser.add_argument("patterns", nargs="*",
+                            help="pastas ou padrões glob com os tabuleiros "
+                                 "(por omissão, as pastas de testes)")
+    run_parser.add_argument("--repeat", type=int, default=5,
+                            help="número de execuções de cada tabuleiro (por omissão, 5)")
+    run_parser.add_argument("--engine", choices=engines, default="cbj",
+                            help="procura a usar (por omissão, cbj)")
+    run_parser.add_argument("--output", metavar="FILE",
+                            help="ficheiro JSON onde guardar os resultados")
+    run_parser.set_defaults(run=run)
+
+    compare_parser = commands.add_parser("compare", help="compara duas execuções de run")
+    compare_parser.add_argument("baseline", help="resultados de referência (JSON)")
+    compare_parser.add_argument("current", help="resultados a comparar (JSON)")
+    compare_parser.add_argument("--alpha", type=float, default=0.05,
+                                help="nível de significância (por omissão, 0.05)")
+    compare_parser.add_argument("--threshold", type=float, default=0.05,
+                                help="variação mínima da mediana a assinalar (por omissão, 0.05)")
+    compare_parser.set_defaults(run=compare)
+
+    startup_parser = commands.add_parser("startup", help="mede o tempo de arranque de pipe.py")
+    startup_parser.add_argument("--board", default=SMALL_BOARD,
+                                help="tabuleiro a resolver (por omissão, test_1-9/test-01.txt)")
+    startup_parser.add_argument("--repeat", type=int, default=10,
+                                help="número de execuções (por omissão, 10)")
+    startup_parser.add_argument("--top", type=int, default=10,
+                                help="número de módulos a mostrar (por omissão, 10)")
+    startup_parser.add_argument("--json", metavar="FILE",
+                                help="guarda também o resultado em JSON")
+    startup_parser.set_defaults(run=startup)
+
+    args = parser.parse_args(argv)
+    return args.run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,388 @@
+"""Resolução distribuída de tabuleiros de PipeMania: um coordenador guarda
+uma fila de trabalhos e qualquer número de trabalhadores, noutras máquinas
+ou na mesma, liga-se a ele por TCP para os ir buscar.
+
+Por exemplo, tudo na mesma máquina:
+    $ python3 cluster.py coordinate test_1-9 'test_10x10-50x50/*.txt' --port 7700 &
+    $ python3 cluster.py work --host 127.0.0.1 --port 7700 --workers 4
+
+Cada trabalho é um tabuleiro inteiro ou, com --split N, uma de pelo menos N
+subárvores de um tabuleiro, dada pela atribuição parcial que a leva da
+raiz até ela (ver parallel.split). Um tabuleiro fica resolvido quando um
+dos seus trabalhos encontra uma solução e sem solução quando todos
+terminam sem a encontrar; os trabalhos que ainda estejam na fila são
+então descartados.
+
+Protocolo: mensagens JSON, uma por linha. O trabalhador envia
+{"type": "ready", "name": ...} e, depois de cada trabalho, {"type":
+"result", "job": ..., "status": "solved" | "unsolved" | "error",
+"solution": ..., "stats": ...}. A cada uma destas mensagens o coordenador
+responde com o trabalho seguinte, {"type": "job", "job": ..., "board": ...,
+"assignment": ..., "engine": ...}, ou com {"type": "done"} quando todos os
+tabuleiros estiverem terminados. Enquanto está ligado, o trabalhador
+envia também {"type": "heartbeat"} a cada HEARTBEAT_INTERVAL segundos,
+mesmo a meio de um trabalho. Se um trabalhador desligar a meio de um
+trabalho, ou passar --worker-timeout segundos sem enviar nada (por
+exemplo, porque a máquina deixou de responder e a ligação nunca chega a
+ser fechada), esse trabalho volta para o início da fila.
+
+O coordenador escreve, como o batch.py, as soluções ao lado dos
+tabuleiros e uma linha por tabuleiro com o ficheiro, o resultado, o
+trabalhador que o terminou, o número de trabalhos e o tempo de procura
+somado de todos eles.
+"""
+
+import argparse
+import asyncio
+import collections
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+
+import pipe
+from batch import find_puzzles
+from parallel import split
+
+# Counters that are combined with max() instead of summed across jobs
+MAX_COUNTERS = {"max_depth", "depth"}
+# Seconds between the heartbeats of a worker
+HEARTBEAT_INTERVAL = 5.0
+
+
+class Coordinator:
+    """Distribui os trabalhos pelos trabalhadores ligados e junta os
+    resultados de cada tabuleiro."""
+
+    def __init__(self, engine: str = "cbj", split_count: int = 1, suffix: str = ".out",
+                 stats_path: str = None, worker_timeout: float = 30.0):
+        self.engine = engine
+        self.split_count = split_count
+        self.suffix = suffix
+        self.stats_path = stats_path
+        # Silence after which a worker with a job is taken for dead
+        self.worker_timeout = worker_timeout
+        self.boards = []
+        self.jobs = collections.deque()
+        self.next_job_id = 0
+        self.unfinished = 0
+        self.failed = 0
+        self.handlers = set()
+        # Connection of each worker running a job, by its handler task
+        self.busy = {}
+
+    def add_board(self, path: str):
+        """Lê o tabuleiro do ficheiro e põe os seus trabalhos na fila."""
+        with open(path) as file:
+            text = file.read()
+        record = {"path": path, "status": None, "worker": None, "jobs": 0, "pending": 0,
+                  "search_time": 0.0, "stats": {}}
+        self.boards.append(record)
+        self.unfinished += 1
+        number = len(self.boards) - 1
+
+        assignments = [[]]
+        if self.split_count > 1:
+            board = pipe.Board.parse_lines(text.splitlines())
+            if board.invalid:
+                self.finish_board(record, "unsolved", "coordinator")
+                return
+            assignments = split(pipe.PipeMania(board.copy()), self.split_count)
+            if isinstance(assignments, pipe.PipeManiaState):
+                solution = board.with_pieces(assignments.board.cells)
+                self.finish_board(record, "solved", "coordinator", str(solution))
+                return
+            if not assignments:
+                self.finish_board(record, "unsolved", "coordinator")
+                return
+
+        record["jobs"] = record["pending"] = len(assignments)
+        for assignment in assignments:
+            self.jobs.append({"type": "job", "job": self.next_job_id, "board_number": number,
+                              "board": text, "assignment": [list(action) for action in assignment],
+                              "engine": self.engine})
+            self.next_job_id += 1
+
+    def next_job(self):
+        """Retira da fila o próximo trabalho de um tabuleiro por terminar."""
+        while self.jobs:
+            job = self.jobs.popleft()
+            if self.boards[job["board_number"]]["status"] is None:
+                return job
+        return None
+
+    def finish_job(self, job: dict, worker: str, message: dict):
+        """Junta o resultado de um trabalho ao do seu tabuleiro."""
+        record = self.boards[job["board_number"]]
+        if record["status"] is not None:
+            # Another subtree of the board already settled it
+            return
+        stats = record["stats"]
+        for name, value in message.get("stats", {}).items():
+            if name in MAX_COUNTERS:
+                stats[name] = max(stats.get(name, value), value)
+            else:
+                stats[name] = stats.get(name, 0) + value
+        record["search_time"] += message.get("stats", {}).get("search_time", 0.0)
+
+        status = message["status"]
+        if status == "unsolved":
+            record["pending"] -= 1
+            if record["pending"]:
+                return
+        self.finish_board(record, status, worker, message.get("solution"))
+
+    def finish_board(self, record: dict, status: str, worker: str, solution: str = None):
+        """Regista o resultado do tabuleiro, escreve a solução e a linha do
+        tabuleiro."""
+        record["status"] = status
+        record["worker"] = worker
+        self.unfinished -= 1
+        self.failed += status != "solved"
+        path = record["path"]
+        if solution is not None:
+            with open(os.path.splitext(path)[0] + self.suffix, "w") as file:
+                file.write(f"{solution}\n")
+        print(f"{path}\t{status}\t{worker}\t{record['jobs']}\t{record['search_time']:.6f}",
+              flush=True)
+        if self.stats_path is not None:
+            line = json.dumps({"path": path, "status": status, "worker": worker,
+                               "jobs": record["jobs"], **record["stats"]})
+            if self.stats_path == "-":
+                print(line, file=sys.stderr)
+            else:
+                with open(self.stats_path, "a") as file:
+                    file.write(line + "\n")
+
+    async def wait_for_job(self):
+        """Espera por um trabalho para um trabalhador. Devolve None quando
+        todos os tabuleiros estiverem terminados."""
+        async with self.changed:
+            while True:
+                job = self.next_job()
+                if job is not None or not self.unfinished:
+                    return job
+                # Jobs running elsewhere may still be requeued
+                await self.changed.wait()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Atende um trabalhador até ele desligar ou não haver mais
+        trabalho."""
+        self.handlers.add(asyncio.current_task())
+        host, port = writer.get_extra_info("peername")[:2]
+        worker = f"{host}:{port}"
+        job = None
+        try:
+            while True:
+                try:
+                    line = await asyncio.wait_for(reader.readline(), self.worker_timeout)
+                except asyncio.TimeoutError:
+                    print(f"dropping worker {worker}: nothing received in "
+                          f"{self.worker_timeout}s", file=sys.stderr)
+                    break
+                if not line:
+                    break
+                message = json.loads(line)
+                if message["type"] == "heartbeat":
+                    continue
+                if message["type"] == "ready":
+                    worker = message.get("name") or worker
+                elif message["type"] == "result" and job is not None:
+                    async with self.changed:
+                        self.finish_job(job, worker, message)
+                        job = None
+                        self.busy.pop(asyncio.current_task(), None)
+                        self.changed.notify_all()
+
+                job = await self.wait_for_job()
+                if job is None:
+                    writer.write(b'{"type": "done"}\n')
+                    await writer.drain()
+                    break
+                self.busy[asyncio.current_task()] = writer
+                writer.write(json.dumps({name: value for name, value in job.items()
+                                         if name != "board_number"}).encode() + b"\n")
+                await writer.drain()
+        except (ConnectionError, ValueError, KeyError) as error:
+            print(f"dropping worker {worker}: {error!r}", file=sys.stderr)
+        finally:
+            if job is not None:
+                # The worker left or went silent in the middle of the job
+                async with self.changed:
+                    self.jobs.appendleft(job)
+                    self.changed.notify_all()
+            writer.close()
+            self.busy.pop(asyncio.current_task(), None)
+            self.handlers.discard(asyncio.current_task())
+
+    async def serve(self, host: str, port: int):
+        """Aceita trabalhadores até todos os tabuleiros estarem terminados."""
+        self.changed = asyncio.Condition()
+        server = await asyncio.start_server(self.handle, host, port)
+        loop = asyncio.get_running_loop()
+        loop.add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+        print(f"listening on {host}:{port}, {len(self.jobs)} jobs", file=sys.stderr, flush=True)
+        async with server:
+            async with self.changed:
+                await self.changed.wait_for(lambda: not self.unfinished)
+        # The idle workers are sent "done"; the ones still searching a
+        # subtree of a settled board see the connection close instead, and
+        # their handlers end on the end of the stream
+        for writer in self.busy.values():
+            writer.close()
+        if self.handlers:
+            await asyncio.wait(self.handlers)
+
+
+def solve_job(job: dict) -> dict:
+    """Resolve um trabalho e devolve a mensagem com o resultado."""
+    stats = pipe.SolverStats()
+    message = {"type": "result", "job": job["job"], "solution": None}
+    try:
+        start = time.perf_counter()
+        board = pipe.Board.parse_lines(job["board"].splitlines(), stats)
+        stats.parse_time = time.perf_counter() - start
+        for row, col, piece in job["assignment"]:
+            if board.invalid:
+                break
+            board.set_piece(row, col, piece)
+        board.trail.clear()
+        solution = None if board.invalid else pipe.solve(board, job["engine"], stats=stats)
+    except Exception as error:
+        message.update(status="error", solution=None, error=repr(error))
+        return message
+    message["status"] = "unsolved" if solution is None else "solved"
+    if solution is not None:
+        message["solution"] = str(solution)
+    message["stats"] = stats.as_dict()
+    return message
+
+
+def connect(host: str, port: int, retry: float) -> socket.socket:
+    """Liga ao coordenador, tentando de novo durante retry segundos (o
+    coordenador pode ainda não ter arrancado)."""
+    deadline = time.monotonic() + retry
+    while True:
+        try:
+            return socket.create_connection((host, port))
+        except OSError:
+            if time.monotonic() >= deadline:
+                raise
+            time.sleep(0.2)
+
+
+def work(host: str, port: int, name: str = None, retry: float = 10.0) -> int:
+    """Resolve trabalhos do coordenador até ele responder "done" ou fechar
+    a ligação (o que faz quando termina com um trabalho ainda a correr, ou
+    quando deixa de esperar pelo trabalhador). Devolve o número de
+    trabalhos resolvidos. Uma thread envia os heartbeats enquanto a
+    ligação está aberta."""
+    name = name or f"{socket.gethostname()}:{os.getpid()}"
+    count = 0
+    with connect(host, port, retry) as connection, connection.makefile("r") as stream:
+        lock = threading.Lock()
+        closed = threading.Event()
+
+        def send(message: dict):
+            # Unbuffered, so that nothing is left to write when the
+            # coordinator closes the connection
+            with lock:
+                connection.sendall((json.dumps(message) + "\n").encode())
+
+        def beat():
+            try:
+                while not closed.wait(HEARTBEAT_INTERVAL):
+                    send({"type": "heartbeat"})
+            except (OSError, ValueError):
+                # The connection was closed under the thread
+                pass
+
+        heartbeat = threading.Thread(target=beat, name="heartbeat", daemon=True)
+        heartbeat.start()
+        try:
+            message = {"type": "ready", "name": name}
+            while True:
+                try:
+                    send(message)
+                    line = stream.readline()
+                except (BrokenPipeError, ConnectionResetError):
+                    break
+                if not line:
+                    break
+                job = json.loads(line)
+                if job["type"] == "done":
+                    break
+                message = solve_job(job)
+                count += 1
+        finally:
+            closed.set()
+            heartbeat.join()
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Resolução distribuída de PipeMania por TCP.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    coordinate_parser = commands.add_parser("coordinate", help="distribui os tabuleiros")
+    coordinate_parser.add_argument("patterns", nargs="+",
+                                   help="pastas ou padrões glob com os tabuleiros (.txt)")
+    coordinate_parser.add_argument("--host", default="127.0.0.1")
+    coordinate_parser.add_argument("--port", type=int, default=7700)
+    coordinate_parser.add_argument("--engine", choices=pipe.engines, default="cbj",
+                                   help="procura a usar nos trabalhadores (por omissão, cbj)")
+    coordinate_parser.add_argument("--split", type=int, default=1, metavar="N",
+                                   help="divide cada tabuleiro em pelo menos N subárvores "
+                                        "(por omissão, 1: um trabalho por tabuleiro)")
+    coordinate_parser.add_argument("--suffix", default=".out",
+                                   help="sufixo dos ficheiros com as soluções (por omissão, .out)")
+    coordinate_parser.add_argument("--stats", nargs="?", const="-", metavar="FILE",
+                                   help="acrescenta as estatísticas de cada tabuleiro, como uma "
+                                        "linha JSON, a FILE (por omissão, ao stderr)")
+    coordinate_parser.add_argument("--worker-timeout", type=float, default=30.0,
+                                   help="segundos sem mensagens ao fim dos quais um trabalhador "
+                                        "é dado como perdido e o seu trabalho volta para a fila "
+                                        "(por omissão, 30; tem de exceder HEARTBEAT_INTERVAL)")
+
+    work_parser = commands.add_parser("work", help="resolve trabalhos do coordenador")
+    work_parser.add_argument("--host", default="127.0.0.1")
+    work_parser.add_argument("--port", type=int, default=7700)
+    work_parser.add_argument("--workers", type=int, default=1,
+                             help="número de processos trabalhadores (por omissão, 1)")
+    work_parser.add_argument("--name", default=None,
+                             help="nome do trabalhador (por omissão, máquina:pid)")
+    work_parser.add_argument("--retry", type=float, default=10.0,
+                             help="segundos a tentar ligar ao coordenador (por omissão, 10)")
+
+    args = parser.parse_args(argv)
+    if args.command == "coordinate":
+        coordinator = Coordinator(args.engine, args.split, args.suffix, args.stats,
+                                  args.worker_timeout)
+        paths = find_puzzles(args.patterns)
+        for path in paths:
+            coordinator.add_board(path)
+        start = time.perf_counter()
+        try:
+            asyncio.run(coordinator.serve(args.host, args.port))
+        except (KeyboardInterrupt, asyncio.CancelledError):
+            return 1
+        elapsed = time.perf_counter() - start
+        print(f"{len(paths)} puzzles in {elapsed:.3f}s, {coordinator.failed} failed",
+              file=sys.stderr)
+        return 1 if coordinator.failed else 0
+
+    if args.workers == 1:
+        work(args.host, args.port, args.name, args.retry)
+        return 0
+    names = [f"{args.name}-{number}" if args.name else None for number in range(args.workers)]
+    with multiprocessing.Pool(args.workers) as pool:
+        pool.starmap(work, [(args.host, args.port, name, args.retry) for name in names])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
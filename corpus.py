@@ -0,0 +1,233 @@
+"""Ficheiros de corpus: muitos tabuleiros de PipeMania num só ficheiro
+binário, lido com mmap.
+
+Por exemplo:
+    $ python3 corpus.py pack tests.pmc test_1-9 test_10x10-50x50
+    $ python3 corpus.py pack solutions.pmc test_10x10-50x50 --suffix .out
+    $ python3 corpus.py list tests.pmc
+    $ python3 corpus.py solve tests.pmc --output solved.pmc
+    $ python3 corpus.py unpack solved.pmc solved/ --suffix .out
+
+Formato (inteiros little-endian):
+    cabeçalho  "PMCB", versão (2 bytes), 2 bytes a zero, número de
+               tabuleiros (4 bytes) e posição do índice (8 bytes);
+    registos   por tabuleiro, o nome em UTF-8 seguido das peças, duas
+               por byte: a máscara de ligações (ver Board.cells) da
+               primeira célula nos 4 bits de baixo e a da seguinte nos 4
+               bits de cima, linha a linha;
+    índice     por tabuleiro, a posição do registo (8 bytes), o tamanho
+               do lado (2 bytes) e o comprimento do nome (2 bytes).
+
+Um tabuleiro de 50x50 ocupa 1250 bytes, contra 7500 em texto. O índice
+fica no fim para o ficheiro poder ser escrito sem saber de antemão
+quantos tabuleiros vai ter.
+"""
+
+import argparse
+import mmap
+import os
+import struct
+import sys
+
+from batch import find_puzzles
+from pipe import Board, engines, solve
+
+MAGIC = b"PMCB"
+VERSION = 1
+HEADER = struct.Struct("<4sHHIQ")
+ENTRY = struct.Struct("<QHH")
+
+# Low and high nibbles of every byte, and each mask moved to the high nibble
+LOW_NIBBLE = bytes(byte & 0xF for byte in range(256))
+HIGH_NIBBLE = bytes(byte >> 4 for byte in range(256))
+TO_HIGH_NIBBLE = bytes((byte << 4) & 0xFF for byte in range(256))
+
+
+def pack_cells(cells) -> bytes:
+    """Junta as máscaras das peças duas a duas num byte."""
+    cells = bytes(cells)
+    if len(cells) % 2:
+        cells += b"\0"
+    low = cells[0::2]
+    high = cells[1::2].translate(TO_HIGH_NIBBLE)
+    # The nibbles don't overlap, so the bytes can be combined as integers
+    combined = int.from_bytes(low, "little") | int.from_bytes(high, "little")
+    return combined.to_bytes(len(low), "little")
+
+
+def unpack_cells(data, count: int) -> bytearray:
+    """Separa as count máscaras de peças guardadas duas por byte."""
+    data = bytes(data)
+    cells = bytearray(len(data) * 2)
+    cells[0::2] = data.translate(LOW_NIBBLE)
+    cells[1::2] = data.translate(HIGH_NIBBLE)
+    del cells[count:]
+    return cells
+
+
+class CorpusWriter:
+    """Escreve um ficheiro de corpus, um tabuleiro de cada vez. Também
+    pode ser usado como gestor de contexto."""
+
+    def __init__(self, path: str):
+        self.file = open(path, "wb")
+        self.index = []
+        self.file.write(HEADER.pack(MAGIC, VERSION, 0, 0, 0))
+
+    def add(self, name: str, cells, size: int):
+        """Acrescenta o tabuleiro com as máscaras de peças dadas."""
+        if len(cells) != size * size:
+            raise ValueError(f"{name}: expected {size * size} cells, got {len(cells)}")
+        encoded_name = name.encode()
+        self.index.append((self.file.tell(), size, len(encoded_name)))
+        self.file.write(encoded_name)
+        self.file.write(pack_cells(cells))
+
+    def close(self):
+        index_offset = self.file.tell()
+        for entry in self.index:
+            self.file.write(ENTRY.pack(*entry))
+        self.file.seek(0)
+        self.file.write(HEADER.pack(MAGIC, VERSION, 0, len(self.index), index_offset))
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class Corpus:
+    """Um ficheiro de corpus aberto para leitura com mmap. Os tabuleiros
+    são lidos pelo índice, sem ler o resto do ficheiro."""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as file:
+            self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, self.count, self.index_offset = HEADER.unpack_from(self.data)
+        if magic != MAGIC:
+            raise ValueError(f"{path}: not a corpus file")
+        if version != VERSION:
+            raise ValueError(f"{path}: unsupported corpus version {version}")
+
+    def __len__(self):
+        return self.count
+
+    def entry(self, number: int) -> tuple:
+        """Devolve a posição, o tamanho do lado e o comprimento do nome do
+        tabuleiro."""
+        if not 0 <= number < self.count:
+            raise IndexError(number)
+        return ENTRY.unpack_from(self.data, self.index_offset + number * ENTRY.size)
+
+    def name(self, number: int) -> str:
+        offset, _, name_length = self.entry(number)
+        return self.data[offset:offset + name_length].decode()
+
+    def cells(self, number: int) -> tuple:
+        """Devolve as máscaras das peças do tabuleiro e o tamanho do lado."""
+        offset, size, name_length = self.entry(number)
+        start = offset + name_length
+        return unpack_cells(self.data[start:start + (size * size + 1) // 2], size * size), size
+
+    def board(self, number: int, stats=None) -> Board:
+        """Cria o tabuleiro, sem passar pelo formato de texto."""
+        return Board.from_cells(*self.cells(number), stats)
+
+    def __iter__(self):
+        for number in range(self.count):
+            yield (self.name(number), *self.cells(number))
+
+    def close(self):
+        self.data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def pack(output: str, paths) -> int:
+    """Escreve os tabuleiros dos ficheiros de texto num corpus. Devolve o
+    número de tabuleiros."""
+    with CorpusWriter(output) as writer:
+        for path in paths:
+            with open(path) as file:
+                cells, size = Board.read_cells(file)
+            writer.add(os.path.splitext(os.path.basename(path))[0], cells, size)
+    return len(writer.index)
+
+
+def unpack(corpus_path: str, directory: str, suffix: str = ".txt") -> int:
+    """Escreve cada tabuleiro do corpus num ficheiro de texto, com o seu
+    nome e o sufixo indicado. Devolve o número de tabuleiros."""
+    os.makedirs(directory, exist_ok=True)
+    with Corpus(corpus_path) as corpus:
+        for name, cells, size in corpus:
+            with open(os.path.join(directory, name + suffix), "w") as file:
+                file.write(f"{Board.format_cells(cells, size)}\n")
+        return len(corpus)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ficheiros de corpus de tabuleiros de PipeMania.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    pack_parser = commands.add_parser("pack", help="junta tabuleiros de texto num corpus")
+    pack_parser.add_argument("output", help="ficheiro de corpus a escrever")
+    pack_parser.add_argument("patterns", nargs="+", help="pastas ou padrões glob com os tabuleiros")
+    pack_parser.add_argument("--suffix", default=".txt",
+                             help="sufixo dos ficheiros a ler das pastas (por omissão, .txt; "
+                                  ".out para soluções)")
+
+    unpack_parser = commands.add_parser("unpack", help="escreve os tabuleiros de um corpus em texto")
+    unpack_parser.add_argument("corpus")
+    unpack_parser.add_argument("directory", help="pasta onde escrever os tabuleiros")
+    unpack_parser.add_argument("--suffix", default=".txt",
+                               help="sufixo dos ficheiros a escrever (por omissão, .txt)")
+
+    list_parser = commands.add_parser("list", help="lista os tabuleiros de um corpus")
+    list_parser.add_argument("corpus")
+
+    solve_parser = commands.add_parser("solve", help="resolve os tabuleiros de um corpus")
+    solve_parser.add_argument("corpus")
+    solve_parser.add_argument("--engine", choices=engines, default="cbj",
+                              help="procura a usar (por omissão, cbj)")
+    solve_parser.add_argument("--output", default=None,
+                              help="corpus onde escrever as soluções")
+
+    args = parser.parse_args(argv)
+    if args.command == "pack":
+        count = pack(args.output, find_puzzles(args.patterns, args.suffix))
+        print(f"{count} boards in {os.path.getsize(args.output)} bytes", file=sys.stderr)
+        return 0
+    if args.command == "unpack":
+        count = unpack(args.corpus, args.directory, args.suffix)
+        print(f"{count} boards", file=sys.stderr)
+        return 0
+
+    with Corpus(args.corpus) as corpus:
+        if args.command == "list":
+            for number in range(len(corpus)):
+                print(f"{number}\t{corpus.name(number)}\t{corpus.entry(number)[1]}")
+            return 0
+
+        failed = 0
+        writer = CorpusWriter(args.output) if args.output else None
+        for number in range(len(corpus)):
+            name = corpus.name(number)
+            solution = solve(corpus.board(number), args.engine)
+            print(f"{name}\t{'solved' if solution is not None else 'unsolved'}", flush=True)
+            if solution is None:
+                failed += 1
+            elif writer is not None:
+                writer.add(name, solution.cells, solution.size)
+        if writer is not None:
+            writer.close()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,161 @@
+"""Relatório da memória usada por uma resolução.
+
+Enquanto a procura corre, uma thread em segundo plano mede a intervalos
+regulares a memória registada pelo tracemalloc e conta os objetos Board
+(e EdgeBoard), PipeManiaState e Node vivos, com a memória de cada tipo.
+Guarda a amostra com mais memória e, nesse momento, um snapshot do
+tracemalloc com as linhas que mais memória alocaram; stop tira uma última
+amostra, para as resoluções mais curtas do que o intervalo. No fim, o
+relatório junta o pico de RSS do processo, o pico do tracemalloc, essa
+divisão por tipo e os bytes por entrada da fronteira da procura.
+
+Os objetos vivos são os do atributo registry de cada classe contada (ver
+search.Registered), um WeakSet preenchido pelos construtores enquanto o
+relatório corre. A thread
+não percorre gc.get_objects(), que pode devolver objetos que a procura
+ainda está a construir.
+
+Os tabuleiros partilham alguns objetos (por exemplo, os nogoods e as
+arestas de cada célula), que são contados apenas uma vez. O tamanho de
+um PipeManiaState ou de um Node não inclui o tabuleiro nem o nó pai, já
+contados nos respetivos tipos.
+
+As classes são dadas por quem cria o relatório e os tipos são reconhecidos
+pelo nome da classe, porque quando pipe.py corre como programa as suas
+classes pertencem ao módulo __main__ e não a pipe.
+"""
+
+import resource
+import sys
+import threading
+import tracemalloc
+import weakref
+
+SCALARS = (int, float, bool, str, bytes, bytearray, type(None))
+# Type reported for each class whose instances are counted
+CENSUS_TYPES = {"Board": "Board", "EdgeBoard": "Board",
+                "PipeManiaState": "PipeManiaState", "Node": "Node"}
+
+
+def deep_size(obj, seen: set) -> int:
+    """Devolve o tamanho de obj e dos objetos a que se refere que ainda não
+    estejam em seen. Não desce aos contadores da resolução (SolverStats)."""
+    size = 0
+    pending = [obj]
+    while pending:
+        obj = pending.pop()
+        if id(obj) in seen or type(obj).__name__ == "SolverStats":
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        if isinstance(obj, SCALARS):
+            continue
+        if isinstance(obj, dict):
+            pending.extend(obj.keys())
+            pending.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            pending.extend(obj)
+        elif hasattr(obj, "__dict__"):
+            pending.append(vars(obj))
+    return size
+
+
+def shallow_size(obj) -> int:
+    """Devolve o tamanho de obj e do dicionário dos seus atributos."""
+    return sys.getsizeof(obj) + sys.getsizeof(vars(obj))
+
+
+def live_objects(registry: weakref.WeakSet) -> list:
+    """Devolve os objetos de registry. A procura pode acrescentar objetos
+    enquanto a lista é feita, caso em que se tenta de novo."""
+    while True:
+        try:
+            return list(registry)
+        except RuntimeError:
+            continue
+
+
+def census(registry: weakref.WeakSet) -> dict:
+    """Conta os tabuleiros, estados e nós vivos de registry e a memória de
+    cada tipo."""
+    counts = {name: [0, 0] for name in CENSUS_TYPES.values()}
+    seen = set()
+    for obj in live_objects(registry):
+        name = CENSUS_TYPES.get(type(obj).__name__)
+        if name is None:
+            continue
+        entry = counts[name]
+        entry[0] += 1
+        entry[1] += deep_size(obj, seen) if name == "Board" else shallow_size(obj)
+    return {name: {"count": count, "bytes": size} for name, (count, size) in counts.items()}
+
+
+class MemoryReport:
+    """Amostra a memória da resolução de stats a cada interval segundos,
+    entre start e stop, contando as instâncias das classes dadas
+    (subclasses de search.Registered)."""
+
+    def __init__(self, stats, classes=(), interval: float = 0.1, top: int = 10):
+        self.stats = stats
+        self.classes = classes
+        self.registry = weakref.WeakSet()
+        self.interval = interval
+        self.top = top
+        self.peak_sample = None
+        self.peak_traced = 0
+        self.top_allocators = []
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="memory", daemon=True)
+
+    def start(self):
+        for cls in self.classes:
+            cls.registry = self.registry
+        tracemalloc.start()
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        # Solves shorter than the interval would have no sample at all
+        self.sample()
+        _, self.peak_traced = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        for cls in self.classes:
+            cls.registry = None
+
+    def sample(self):
+        traced, _ = tracemalloc.get_traced_memory()
+        if self.peak_sample is not None and traced <= self.peak_sample["traced"]:
+            return
+        snapshot = tracemalloc.take_snapshot()
+        types = census(self.registry)
+        frontier = self.stats.frontier_size()
+        frontier_bytes = sum(entry["bytes"] for entry in types.values())
+        if self.stats.frontier is not None:
+            # The search's own stack or layer
+            frontier_bytes += deep_size(self.stats.frontier, set())
+        self.peak_sample = {
+            "traced": traced,
+            "types": types,
+            "frontier": frontier,
+            "bytes_per_frontier_entry": frontier_bytes // frontier if frontier else None,
+        }
+        self.top_allocators = [
+            {"location": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+             "bytes": stat.size, "blocks": stat.count}
+            for stat in snapshot.statistics("lineno")[:self.top]]
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.sample()
+
+    def as_dict(self) -> dict:
+        """Devolve o relatório, com as memórias em bytes. O getrusage dá o
+        pico de RSS em KiB no Linux e em bytes no macOS."""
+        scale = 1 if sys.platform == "darwin" else 1024
+        return {
+            "peak_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+            "peak_traced": self.peak_traced,
+            "peak_sample": self.peak_sample,
+            "top_allocators": self.top_allocators,
+        }
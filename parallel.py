@@ -0,0 +1,201 @@
+"""Procura em profundidade paralela para um único tabuleiro de PipeMania.
+
+Por exemplo:
+    $ python3 parallel.py --workers 4 < test-01.txt
+
+Os níveis de cima da árvore de procura são expandidos com PipeMania.actions
+e PipeMania.result até haver algumas subárvores por processo. Cada subárvore
+é uma atribuição parcial (a lista de peças colocadas desde a raiz) e fica
+numa fila partilhada. Cada processo retira uma atribuição, coloca as suas
+peças numa cópia do tabuleiro e procura a partir dela com
+backjumping_search, a procura usada por omissão.
+
+Quando um processo fica sem trabalho, os outros dividem o seu: a intervalos
+de pipe.DONATE_INTERVAL decisões, a procura de um processo que veja
+processos à espera passa para a fila as alternativas ainda por
+experimentar no nível mais alto da sua pilha, que são as subárvores
+maiores. Os processos só devolvem as peças do tabuleiro resolvido.
+"""
+
+import argparse
+import multiprocessing
+import os
+import queue
+import sys
+
+from pipe import Board, PipeMania, PipeManiaState, backjumping_search
+
+
+def split(problem: PipeMania, count: int):
+    """Expande os níveis de cima da árvore de procura, em largura, até haver
+    pelo menos count subárvores. Devolve as atribuições parciais das
+    subárvores, como listas de ações, ou o estado objetivo, se for
+    encontrado antes."""
+    frontier = [(problem.initial, [])]
+    while frontier and len(frontier) < count:
+        next_frontier = []
+        for state, assignment in frontier:
+            if problem.goal_test(state):
+                return state
+            for action in problem.actions(state):
+                child = problem.result(state, action)
+                if not child.board.invalid:
+                    next_frontier.append((child, assignment + [action]))
+        if not next_frontier:
+            break
+        frontier = next_frontier
+
+    for state, _ in frontier:
+        if problem.goal_test(state):
+            return state
+    return [assignment for _, assignment in frontier]
+
+
+class SearchStopped(Exception):
+    pass
+
+
+class Worker:
+    """Procura nas subárvores da fila partilhada até alguém encontrar uma
+    solução ou todas as subárvores estarem esgotadas. É o donor de
+    backjumping_search."""
+
+    def __init__(self, board: Board, tasks, results, pending, idle, stop):
+        self.board = board
+        self.tasks = tasks
+        self.results = results
+        # Subtrees queued or being searched
+        self.pending = pending
+        # Workers waiting for a subtree
+        self.idle = idle
+        self.stop = stop
+        # Assignment of the subtree being searched
+        self.assignment = None
+
+    def run(self):
+        # Subtrees left in the queue when the search stops are discarded
+        self.tasks.cancel_join_thread()
+        waiting = False
+        while not self.stop.is_set():
+            try:
+                assignment = self.tasks.get(timeout=0.05)
+            except queue.Empty:
+                if not waiting:
+                    waiting = True
+                    with self.idle.get_lock():
+                        self.idle.value += 1
+                continue
+            if waiting:
+                waiting = False
+                with self.idle.get_lock():
+                    self.idle.value -= 1
+
+            cells = self.search(assignment)
+            if cells is not None:
+                self.results.put(cells)
+                return
+            with self.pending.get_lock():
+                self.pending.value -= 1
+                if self.pending.value == 0:
+                    # Every subtree was searched without finding a solution
+                    self.results.put(None)
+
+    def wanted(self) -> bool:
+        """Indica se há processos à espera de trabalho. Interrompe a procura
+        se outro processo já encontrou uma solução."""
+        if self.stop.is_set():
+            raise SearchStopped()
+        return self.idle.value > 0
+
+    def give(self, prefix: list, actions: list):
+        """Passa para a fila as subárvores das ações, a seguir ao prefixo
+        da subárvore em procura."""
+        with self.pending.get_lock():
+            self.pending.value += len(actions)
+        for action in actions:
+            self.tasks.put(self.assignment + prefix + [action])
+
+    def search(self, assignment: list):
+        """Procura na subárvore da atribuição. Devolve as peças do
+        tabuleiro resolvido, ou None."""
+        board = self.board.copy()
+        # Nogoods learned below one assignment don't hold below another
+        board.nogoods = {}
+        problem = PipeMania(board)
+        state = problem.initial
+        for action in assignment:
+            problem.apply(state, tuple(action))
+            if board.invalid:
+                return None
+        board.trail.clear()
+
+        self.assignment = assignment
+        try:
+            node = backjumping_search(problem, self)
+        except SearchStopped:
+            return None
+        return bytes(node.state.board.cells) if node is not None else None
+
+
+def run_worker(*args):
+    Worker(*args).run()
+
+
+def solve_parallel(board: Board, workers: int = None, split_factor: int = 4):
+    """Resolve o tabuleiro com workers processos. Devolve o tabuleiro
+    resolvido, ou None se não houver solução."""
+    workers = workers or os.cpu_count()
+    problem = PipeMania(board.copy())
+    if board.invalid:
+        return None
+    assignments = split(problem, workers * split_factor)
+    if isinstance(assignments, PipeManiaState):
+        return board.with_pieces(assignments.board.cells)
+    if not assignments:
+        return None
+
+    context = multiprocessing.get_context()
+    tasks = context.Queue()
+    results = context.Queue()
+    pending = context.Value("i", len(assignments))
+    idle = context.Value("i", 0)
+    stop = context.Event()
+    for assignment in assignments:
+        tasks.put(assignment)
+
+    processes = [context.Process(target=run_worker,
+                                 args=(board, tasks, results, pending, idle, stop),
+                                 daemon=True)
+                 for _ in range(workers)]
+    for process in processes:
+        process.start()
+    try:
+        cells = results.get()
+    finally:
+        stop.set()
+        for process in processes:
+            process.join(timeout=1)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+
+    return board.with_pieces(cells) if cells is not None else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Resolve um tabuleiro de PipeMania lido do stdin "
+                                                 "com uma procura em profundidade paralela.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="número de processos (por omissão, um por CPU)")
+    parser.add_argument("--split-factor", type=int, default=4,
+                        help="subárvores iniciais por processo (por omissão, 4)")
+    args = parser.parse_args(argv)
+
+    board = Board.parse_instance()
+    solution = solve_parallel(board, args.workers, args.split_factor)
+    print(solution)
+    return 0 if solution is not None else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,17 @@
 # Grupo 44:
 # 99991 João Sousa
 
+import argparse
+import functools
+import itertools
+import operator
+import random
 import sys
+import time
 from search import (
     Problem,
     Node,
+    Registered,
     astar_search,
     breadth_first_tree_search,
     depth_first_tree_search,
@@ -12,95 +19,359 @@ from search import (
     recursive_best_first_search,
 )
 
-pieces = ("FC", "FB", "FE", "FD", "BC", "BB", "BE",
-          "BD", "VC", "VB", "VE", "VD", "LV", "LH")
-
-connection = {
-    "up": ("FC", "BC", "BE", "BD", "VC", "VD", "LV"),
-    "down": ("FB", "BB", "BE", "BD", "VB", "VE", "LV"),
-    "left": ("FE", "BC", "BB", "BE", "VC", "VE", "LH"),
-    "right": ("FD", "BC", "BB", "BD", "VB", "VD", "LH")
-}
-
-closing_connection = {
-    "up": ("BC", "BE", "BD", "VC", "VD", "LV"),
-    "down": ("BB", "BE", "BD", "VB", "VE", "LV"),
-    "left": ("BC", "BB", "BE", "VC", "VE", "LH"),
-    "right": ("BC", "BB", "BD", "VB", "VD", "LH")
+# Each piece is represented internally as a 4-bit mask of the sides it
+# connects to. The two-letter codes are only used when reading and printing.
+UP, DOWN, LEFT, RIGHT = 1, 2, 4, 8
+SIDES = (UP, DOWN, LEFT, RIGHT)
+OPPOSITE = {UP: DOWN, DOWN: UP, LEFT: RIGHT, RIGHT: LEFT}
+
+piece_masks = {
+    "FC": UP, "FB": DOWN, "FE": LEFT, "FD": RIGHT,
+    "BC": UP | LEFT | RIGHT, "BB": DOWN | LEFT | RIGHT,
+    "BE": UP | DOWN | LEFT, "BD": UP | DOWN | RIGHT,
+    "VC": UP | LEFT, "VB": DOWN | RIGHT, "VE": DOWN | LEFT, "VD": UP | RIGHT,
+    "LV": UP | DOWN, "LH": LEFT | RIGHT,
 }
+piece_codes = {mask: code for code, mask in piece_masks.items()}
+
+FC, FB, FE, FD = UP, DOWN, LEFT, RIGHT
+BC, BB, BE, BD = UP | LEFT | RIGHT, DOWN | LEFT | RIGHT, UP | DOWN | LEFT, UP | DOWN | RIGHT
+VC, VB, VE, VD = UP | LEFT, DOWN | RIGHT, DOWN | LEFT, UP | RIGHT
+LV, LH = UP | DOWN, LEFT | RIGHT
+
+# Orientations of each piece family, in the order they are tried
+CLOSING, BIFURCATION, CORNER, STRAIGHT = 0, 1, 2, 3
+family_orientations = (
+    (FC, FB, FE, FD),
+    (BC, BB, BE, BD),
+    (VC, VB, VE, VD),
+    (LV, LH),
+)
+piece_family = {piece: family
+                for family, orientations in enumerate(family_orientations)
+                for piece in orientations}
+
+# State of each side of a cell, as seen from the cell
+FREE, CONNECTED, BLOCKED = 0, 1, 2
+side_weights = {UP: 1, DOWN: 3, LEFT: 9, RIGHT: 27}
+
+
+def build_orientation_table():
+    """Calcula, para cada família de peças e cada combinação dos estados dos
+    quatro lados (livre, ligado ou bloqueado), as orientações possíveis.
+
+    As orientações possíveis de uma célula (o seu domínio) são guardadas
+    como uma máscara em que o bit i corresponde a family_orientations[i]."""
+    table = []
+    for orientations in family_orientations:
+        family_table = []
+        for index in range(3 ** 4):
+            connected = blocked = 0
+            for side in SIDES:
+                state = index // side_weights[side] % 3
+                if state == CONNECTED:
+                    connected |= side
+                elif state == BLOCKED:
+                    blocked |= side
+            family_table.append(sum(
+                1 << i for i, piece in enumerate(orientations)
+                if piece & connected == connected and not piece & blocked))
+        table.append(tuple(family_table))
+    return tuple(table)
+
+
+orientation_table = build_orientation_table()
+
+# Kinds of changes recorded on a board's trail
+CELL_CHANGE, DOMAIN_CHANGE, REMAINING_CHANGE, UNION_CHANGE, REASON_CHANGE = 0, 1, 2, 3, 4
+
+# States of an edge between two cells in the edge model
+UNKNOWN_EDGE, OPEN_EDGE, CLOSED_EDGE = 0, 1, 2
+
+# Largest learned nogood kept by a board, in number of placed pieces
+MAX_NOGOOD_SIZE = 8
+
+# Decisions between the checks of backjumping_search for a donor wanting work
+DONATE_INTERVAL = 256
+
+# Pieces in each domain mask of each family, and the size of each domain
+domain_values = tuple(
+    tuple(tuple(piece for i, piece in enumerate(orientations) if domain >> i & 1)
+          for domain in range(16))
+    for orientations in family_orientations)
+domain_size = tuple(bin(domain).count("1") for domain in range(16))
+full_domain = tuple((1 << len(orientations)) - 1
+                    for orientations in family_orientations)
+piece_domain = {piece: 1 << i
+                for orientations in family_orientations
+                for i, piece in enumerate(orientations)}
+
+# Sides present in every piece of each domain, and in at least one of them
+domain_sides = tuple(
+    tuple((
+        functools.reduce(operator.and_, values, UP | DOWN | LEFT | RIGHT) if values else 0,
+        functools.reduce(operator.or_, values, 0))
+        for values in family_values)
+    for family_values in domain_values)
+
+
+class SolverStats:
+    """Contadores de uma resolução, partilhados pelo problema e por todas
+    as cópias do tabuleiro. Só são atualizados quando o problema é criado
+    com um SolverStats; sem ele, cada ponto de contagem custa apenas uma
+    comparação com None.
+
+    nodes_expanded conta os estados cujas ações foram pedidas,
+    nodes_generated as ações aplicadas e backtracks as que deixaram o
+    tabuleiro inválido. wipeouts conta os domínios esvaziados pela
+    propagação. Os tempos são em segundos.
+
+    Durante a procura, depth e board guardam a profundidade e o tabuleiro
+    do último estado gerado e frontier a pilha ou fronteira da procura,
+    se a procura a indicar, para serem consultados por outra thread (ver
+    progress.py)."""
+
+    def __init__(self):
+        self.nodes_generated = 0
+        self.nodes_expanded = 0
+        self.actions_for_cell = 0
+        self.wipeouts = 0
+        self.max_depth = 0
+        self.backtracks = 0
+        self.parse_time = 0.0
+        self.search_time = 0.0
+        self.output_time = 0.0
+        self.depth = 0
+        self.board = None
+        self.frontier = None
+
+    def frontier_size(self) -> int:
+        """Devolve o tamanho da fronteira. Nas procuras em árvore, que não a
+        indicam, cada estado expandido saiu da fronteira e cada estado
+        gerado entrou nela."""
+        if self.frontier is not None:
+            return len(self.frontier)
+        return max(0, 1 + self.nodes_generated - self.nodes_expanded)
+
+    def as_dict(self) -> dict:
+        """Devolve os contadores e os tempos."""
+        return {name: value for name, value in vars(self).items()
+                if name not in ("board", "frontier")}
+
+
+class SearchOrder:
+    """Ordem alternativa pela qual a procura escolhe as células e
+    experimenta as peças, para correr várias procuras diferentes sobre o
+    mesmo tabuleiro (ver portfolio.py).
+
+    Entre as células com menos possibilidades, cell_order escolhe a que
+    mudou mais recentemente ("newest", a ordem habitual), a que mudou há
+    mais tempo ("oldest") ou a primeira numa permutação aleatória fixa das
+    células ("random"). value_order experimenta as peças pela ordem
+    habitual ("default"), pela ordem inversa ("reverse") ou por uma ordem
+    aleatória ("random"). A ordem aleatória das células não muda durante a
+    procura, para que a mesma célula seja escolhida enquanto o tabuleiro
+    não mudar."""
+
+    cell_orders = ("newest", "oldest", "random")
+    value_orders = ("default", "reverse", "random")
+
+    def __init__(self, cell_order: str = "newest", value_order: str = "default", seed=None):
+        self.cell_order = cell_order
+        self.value_order = value_order
+        self.seed = seed
+        self.random = random.Random(seed)
+        self.priority = None
+
+    def next_cell(self, scheduler: 'CellScheduler'):
+        """Devolve a próxima célula a preencher, ou None."""
+        for bucket in scheduler.buckets:
+            if bucket:
+                if self.cell_order == "newest":
+                    return bucket[-1]
+                if self.cell_order == "oldest":
+                    return bucket[0]
+                if self.priority is None:
+                    self.priority = list(range(len(scheduler.position)))
+                    self.random.shuffle(self.priority)
+                return min(bucket, key=self.priority.__getitem__)
+        return None
+
+    def order_values(self, values: tuple) -> tuple:
+        """Devolve as peças possíveis de uma célula pela ordem a
+        experimentar."""
+        if self.value_order == "reverse":
+            return values[::-1]
+        if self.value_order == "random":
+            return tuple(self.random.sample(values, len(values)))
+        return values
 
-
-def no_connection(direction):
-    return tuple(piece for piece in pieces if piece not in connection[direction])
+    def __repr__(self):
+        return f"SearchOrder({self.cell_order!r}, {self.value_order!r}, {self.seed!r})"
 
 
-class PipeManiaState:
+class PipeManiaState(Registered):
     state_id = 0
-
-    def __init__(self, board):
+    def __init__(self, board, depth: int = 0):
         self.board = board
+        self.depth = depth
         self.id = PipeManiaState.state_id
         PipeManiaState.state_id += 1
+        self.register()
 
     def __lt__(self, other):
         return self.id < other.id
 
 
-class Board:
-    """Representação interna de um tabuleiro de PipeMania."""
-
-    def __init__(self, cells: tuple):
+class CellScheduler:
+    """Conjunto das células por preencher, agrupadas pelo tamanho do seu
+    domínio (de 1 a 4), para obter em tempo constante uma das células com
+    menos possibilidades.
+
+    Cada grupo é uma lista e position guarda a posição de cada célula na
+    sua lista, para que retirar ou mudar uma célula de grupo seja também
+    feito em tempo constante."""
+
+    def __init__(self, count: int):
+        self.buckets = [[] for _ in range(5)]
+        # Bucket of each cell, or 0 if the cell is not scheduled
+        self.bucket = bytearray(count)
+        self.position = [0] * count
+        self.count = 0
+
+    def add(self, index: int, size: int):
+        """Acrescenta a célula index ao grupo do tamanho especificado."""
+        bucket = self.buckets[size]
+        self.bucket[index] = size
+        self.position[index] = len(bucket)
+        bucket.append(index)
+        self.count += 1
+
+    def remove(self, index: int):
+        """Retira a célula index do seu grupo."""
+        bucket = self.buckets[self.bucket[index]]
+        position = self.position[index]
+        # Move the last cell of the bucket into the freed position
+        last = bucket.pop()
+        if last != index:
+            bucket[position] = last
+            self.position[last] = position
+        self.bucket[index] = 0
+        self.count -= 1
+
+    def update(self, index: int, size: int):
+        """Muda a célula index para o grupo do tamanho especificado, se
+        estiver por preencher."""
+        if self.bucket[index] and self.bucket[index] != size:
+            self.remove(index)
+            self.add(index, size)
+
+    def first(self):
+        """Devolve uma das células com menos possibilidades, ou None se não
+        houver células por preencher."""
+        for bucket in self.buckets:
+            if bucket:
+                # The most recently updated cell is usually next to the last
+                # placed piece
+                return bucket[-1]
+        return None
+
+    def copy(self) -> 'CellScheduler':
+        new_scheduler = CellScheduler(0)
+        new_scheduler.buckets = [bucket[:] for bucket in self.buckets]
+        new_scheduler.bucket = bytearray(self.bucket)
+        new_scheduler.position = self.position[:]
+        new_scheduler.count = self.count
+        return new_scheduler
+
+    def __len__(self):
+        return self.count
+
+
+class Board(Registered):
+    """Representação interna de um tabuleiro de PipeMania.
+
+    As células são guardadas num único bytearray, linha a linha, com a
+    máscara da peça de cada posição. O domínio de cada célula é guardado
+    num bytearray paralelo (ver build_orientation_table) e um terceiro
+    indica as células em que já foi colocada uma peça. As células por
+    preencher são escalonadas por um CellScheduler.
+
+    As peças colocadas são agrupadas em componentes ligadas por uma
+    estrutura union-find (parent, component_size), que guarda também o
+    número de ligações de cada componente ainda sem peça do outro lado
+    (open_ends). Uma componente sem ligações abertas antes de o tabuleiro
+    estar completo torna o tabuleiro inválido.
+
+    O tabuleiro pode ser alterado no lugar com set_piece: cada alteração
+    fica registada em trail e pode ser desfeita com undo.
+
+    Para o retrocesso dirigido por conflitos, cada peça colocada pela
+    procura tem um nível de decisão (level) e reasons guarda, para cada
+    célula, o conjunto (como máscara de bits) dos níveis de decisão que
+    explicam o seu domínio atual. Quando o tabuleiro fica inválido,
+    conflict guarda os níveis que explicam o conflito. Os nogoods
+    aprendidos (conjuntos de peças colocadas que não levam a uma solução)
+    também tornam o tabuleiro inválido."""
+
+    def __init__(self, cells: bytearray, size: int):
         """Construtor da classe."""
         self.cells = cells
-        self.remaining_cells = []
-        self.size = len(cells)
+        self.domains = bytearray(len(cells))
+        self.placed = bytearray(len(cells))
+        self.remaining_cells = CellScheduler(len(cells))
+        self.size = size
         self.invalid = False
+        self.trail = []
+        # Cells waiting to be revised by propagate
+        self.queued = bytearray(len(cells))
+        # Union-find over the placed cells, without path compression so
+        # that unions can be undone
+        self.parent = list(range(len(cells)))
+        self.component_size = [1] * len(cells)
+        self.open_ends = [0] * len(cells)
+        self.components = 0
+        # Decision levels explaining the pieces of each component
+        self.component_reasons = [0] * len(cells)
+        # Conflict-directed backjumping
+        self.level = 0
+        self.reasons = [0] * len(cells)
+        self.conflict = 0
+        # Learned nogoods, indexed by each of their (cell, piece) pairs
+        self.nogoods = {}
+        self.stats = None
+        # Alternative search order, or None for the usual one
+        self.order = None
+        self.register()
 
     def calculate_state(self):
         """ Calcula o estado interno do tabuleiro para ser usado no tabuleiro
         inicial """
 
-        temp_cells = []
-        # Initialize as list of empty tuples
-        self.possible_values = []
-
-        # Calculate possible_values, which will use actions_for_cell
-        for row in range(self.size):
-            row_possibilities = ()
-            for col in range(self.size):
-                actions = self.actions_for_cell(row, col)
+        # Start from every orientation and propagate the borders
+        for index, piece in enumerate(self.cells):
+            domain = full_domain[piece_family[piece]]
+            self.domains[index] = domain
+            self.remaining_cells.add(index, domain_size[domain])
 
-                if len(actions) == 0:
-                    self.invalid = True
-                    return self
-                else:
-                    # Append a tuple (row, col, actions) to temp_cells
-                    temp_cells.append((row, col, actions))
-
-                row_possibilities += (actions,)
-
-            self.possible_values += (row_possibilities,)
-
-        # Sort temp_cells by the length of actions
-        temp_cells.sort(key=lambda x: len(x[2]))
-
-        # Create remaining_cells from the sorted temp_cells
-        self.remaining_cells = [(row, col) for row, col, actions in temp_cells]
+        self.propagate(list(range(len(self.cells))))
+        self.trail.clear()
 
         return self
 
     def get_value(self, row: int, col: int) -> str:
         """Devolve o valor na respetiva posição do tabuleiro."""
         if 0 <= row < self.size and 0 <= col < self.size:
-            return self.cells[row][col]
+            return piece_codes[self.cells[row * self.size + col]]
 
     def get_row(self, row: int) -> tuple:
         """Devolve a linha especificada."""
-        return self.cells[row]
+        start = row * self.size
+        return tuple(map(piece_codes.get, self.cells[start:start + self.size]))
 
     def get_col(self, col: int) -> tuple:
         """Devolve a coluna especificada."""
-        return tuple(self.cells[row][col] for row in range(self.size))
+        return tuple(map(piece_codes.get, self.cells[col::self.size]))
 
     def adjacent_vertical_values(self, row: int, col: int) -> (str, str):
         """Devolve os valores imediatamente acima e abaixo,
@@ -112,110 +383,348 @@ class Board:
         respectivamente."""
         return self.get_value(row, col - 1), self.get_value(row, col + 1)
 
-    def place_piece(self, row: int, col: int, piece) -> 'Board':
-        """Place a piece on the board at the specified position."""
-        new_row = self.cells[row][:col] + (piece,) + self.cells[row][col + 1:]
-        new_cells = self.cells[:row] + (new_row,) + self.cells[row + 1:]
-        new_board = Board(new_cells)
-
-        # Update other attributes
-        new_board.remaining_cells = self.remaining_cells[1:]
-        new_board.possible_values = self.possible_values
-        new_board.calculate_next_possible_pieces(row, col)
-
-        # Sort remaining_cells by the length of possible actions for each cell
-        new_board.remaining_cells.sort(key=lambda cell: len(
-            new_board.possible_values[cell[0]][cell[1]]))
-
+    def copy(self) -> 'Board':
+        """Devolve uma cópia do tabuleiro, sem o rasto de alterações."""
+        new_board = Board(bytearray(self.cells), self.size)
+        new_board.domains[:] = self.domains
+        new_board.placed[:] = self.placed
+        new_board.remaining_cells = self.remaining_cells.copy()
+        new_board.invalid = self.invalid
+        new_board.parent = self.parent[:]
+        new_board.component_size = self.component_size[:]
+        new_board.open_ends = self.open_ends[:]
+        new_board.components = self.components
+        new_board.component_reasons = self.component_reasons[:]
+        new_board.level = self.level
+        new_board.reasons = self.reasons[:]
+        new_board.conflict = self.conflict
+        new_board.nogoods = self.nogoods
+        new_board.stats = self.stats
+        new_board.order = self.order
         return new_board
 
-    def calculate_next_possible_pieces(self, row: int, col: int):
-        """Calcula as possibilidades para a posição que foi alterada.   
-        Atualiza a linha e coluna afetadas."""
+    def with_pieces(self, pieces) -> 'Board':
+        """Devolve uma cópia do tabuleiro com as peças dadas (uma por
+        célula) colocadas nas células por preencher."""
+        new_board = self.copy()
+        for index, piece in enumerate(pieces):
+            if not new_board.placed[index]:
+                new_board.fill_cell(index, piece)
+        new_board.trail.clear()
+        return new_board
 
-        # Define the coordinates of the adjacent cells
-        adjacent_cells = [(row - 1, col), (row + 1, col),
-                          (row, col - 1), (row, col + 1)]
+    def place_piece(self, row: int, col: int, piece) -> 'Board':
+        """Place a piece on a copy of the board at the specified position."""
+        new_board = self.copy()
+        new_board.set_piece(row, col, piece)
+        new_board.trail.clear()
+        return new_board
 
-        # Initialize new_possible_values as a copy of the current possible_values
-        new_possible_values = list(map(list, self.possible_values))
+    def set_piece(self, row: int, col: int, piece):
+        """Place a piece on this board at the specified position, recording
+        every change on the trail, and propagate its consequences."""
+        index = row * self.size + col
+        # The piece is explained by the current decision level
+        reason = self.reasons[index] | 1 << self.level
+        if reason != self.reasons[index]:
+            self.trail.append((REASON_CHANGE, index, self.reasons[index]))
+            self.reasons[index] = reason
+
+        self.fill_cell(index, piece)
+        if not self.invalid:
+            self.calculate_next_possible_pieces(row, col)
+
+    def fill_cell(self, index: int, piece):
+        """Coloca a peça na célula index, registando as alterações no
+        rasto, sem propagar as restrições. Junta a célula às componentes
+        das peças adjacentes a que fica ligada."""
+        self.trail.append((CELL_CHANGE, index, self.cells[index]))
+        self.trail.append((REMAINING_CHANGE, index, None))
+        self.cells[index] = piece
+        self.placed[index] = 1
+        self.remaining_cells.remove(index)
+
+        domain = piece_domain[piece]
+        if self.domains[index] != domain:
+            self.trail.append((DOMAIN_CHANGE, index, self.domains[index]))
+            self.domains[index] = domain
+
+        self.open_ends[index] = domain_size[piece]
+        self.component_reasons[index] = self.reasons[index]
+        self.components += 1
+
+        size, placed = self.size, self.placed
+        if piece & UP and placed[index - size]:
+            self.join(index, index - size)
+        if piece & DOWN and placed[index + size]:
+            self.join(index, index + size)
+        if piece & LEFT and placed[index - 1]:
+            self.join(index, index - 1)
+        if piece & RIGHT and placed[index + 1]:
+            self.join(index, index + 1)
+
+        # A component without open ends can't reach the remaining cells
+        root = self.find(index)
+        if self.open_ends[root] == 0 and self.remaining_cells:
+            self.invalid = True
+            self.conflict = self.component_reasons[root]
+            return
+
+        if self.nogoods:
+            for nogood in self.nogoods.get(index << 4 | piece, ()):
+                if all(placed[cell] and self.cells[cell] == value for cell, value in nogood):
+                    self.invalid = True
+                    self.conflict = functools.reduce(
+                        operator.or_, (self.reasons[cell] for cell, _ in nogood))
+                    return
+
+    def learn(self, nogood: tuple):
+        """Guarda um nogood, um tuplo de pares (célula, peça) que não podem
+        estar todos colocados numa solução."""
+        if len(nogood) <= MAX_NOGOOD_SIZE:
+            for cell, piece in nogood:
+                self.nogoods.setdefault(cell << 4 | piece, []).append(nogood)
+
+    def find(self, index: int) -> int:
+        """Devolve a raiz da componente da célula index."""
+        parent = self.parent
+        while parent[index] != index:
+            index = parent[index]
+        return index
+
+    def join(self, a: int, b: int):
+        """Junta as componentes das células a e b, ligadas entre si."""
+        a, b = self.find(a), self.find(b)
+        if a == b:
+            # The new connection closes a loop inside the component
+            self.trail.append((UNION_CHANGE, a, (self.open_ends[a], self.component_reasons[a])))
+            self.open_ends[a] -= 2
+            return
+
+        if self.component_size[a] > self.component_size[b]:
+            a, b = b, a
+        self.trail.append((UNION_CHANGE, a, (self.open_ends[b], self.component_reasons[b])))
+        self.parent[a] = b
+        self.component_size[b] += self.component_size[a]
+        self.open_ends[b] += self.open_ends[a] - 2
+        self.component_reasons[b] |= self.component_reasons[a]
+        self.components -= 1
+
+    def undo(self, mark: int):
+        """Desfaz as alterações registadas no rasto depois de mark."""
+        trail = self.trail
+        while len(trail) > mark:
+            kind, index, value = trail.pop()
+            if kind == CELL_CHANGE:
+                self.cells[index] = value
+                self.placed[index] = 0
+                self.components -= 1
+            elif kind == REASON_CHANGE:
+                self.reasons[index] = value
+            elif kind == UNION_CHANGE:
+                root = self.parent[index]
+                self.open_ends[root], self.component_reasons[root] = value
+                if root != index:
+                    self.parent[index] = index
+                    self.component_size[root] -= self.component_size[index]
+                    self.components += 1
+            elif kind == DOMAIN_CHANGE:
+                self.domains[index] = value
+                self.remaining_cells.update(index, domain_size[value])
+            else:
+                self.remaining_cells.add(index, domain_size[self.domains[index]])
+        # Changes are only made on valid boards
+        self.invalid = False
 
-        for r, c in adjacent_cells:
-            # Skip cells that are out of bounds
-            if r < 0 or r >= self.size or c < 0 or c >= self.size:
+    def calculate_next_possible_pieces(self, row: int, col: int):
+        """Calcula as possibilidades para as posições adjacentes à que foi
+        alterada e propaga as restrições pelo resto do tabuleiro."""
+        size = self.size
+        index = row * size + col
+        queue = []
+
+        # Skip cells that are out of bounds
+        if row != 0:
+            queue.append(index - size)
+        if row != size - 1:
+            queue.append(index + size)
+        if col != 0:
+            queue.append(index - 1)
+        if col != size - 1:
+            queue.append(index + 1)
+
+        self.propagate(queue)
+
+    def propagate(self, queue: list):
+        """Revê os domínios das células em queue até não haver alterações
+        (ou até um domínio ficar vazio, tornando o tabuleiro inválido).
+
+        Sempre que um domínio diminui, as células adjacentes voltam a ser
+        revistas, e uma célula com uma única possibilidade é preenchida."""
+        cells, domains, placed, queued = self.cells, self.domains, self.placed, self.queued
+        reasons = self.reasons
+        size = self.size
+        trail = self.trail
+
+        for index in queue:
+            queued[index] = 1
+
+        while queue:
+            index = queue.pop()
+            queued[index] = 0
+            if placed[index]:
                 continue
 
-            old_possibilities = self.get_possibilities_for_cell(r, c)
-            if len(old_possibilities) == 0:
+            row, col = divmod(index, size)
+            old_domain = domains[index]
+            domain = old_domain & self.actions_for_cell(row, col)
+            if domain == old_domain:
                 continue
 
-            possibilities = tuple(self.actions_for_cell(r, c))
-
-            if len(possibilities) == 0:
+            # The new domain is explained by the neighbors' domains
+            reason = reasons[index]
+            if row != 0:
+                reason |= reasons[index - size]
+            if row != size - 1:
+                reason |= reasons[index + size]
+            if col != 0:
+                reason |= reasons[index - 1]
+            if col != size - 1:
+                reason |= reasons[index + 1]
+
+            if domain == 0:
                 self.invalid = True
+                self.conflict = reason
+                if self.stats is not None:
+                    self.stats.wipeouts += 1
+                for index in queue:
+                    queued[index] = 0
                 return
 
-            new_possible_values[r][c] = possibilities
-
-        self.possible_values = tuple(map(tuple, new_possible_values))
+            trail.append((DOMAIN_CHANGE, index, old_domain))
+            domains[index] = domain
+            if reason != reasons[index]:
+                trail.append((REASON_CHANGE, index, reasons[index]))
+                reasons[index] = reason
+            if domain_size[domain] == 1:
+                self.fill_cell(index, domain_values[piece_family[cells[index]]][domain][0])
+                if self.invalid:
+                    for index in queue:
+                        queued[index] = 0
+                    return
+            else:
+                self.remaining_cells.update(index, domain_size[domain])
+
+            # Revise the neighbors that aren't filled or already queued
+            if row != 0 and not placed[index - size] and not queued[index - size]:
+                queued[index - size] = 1
+                queue.append(index - size)
+            if row != size - 1 and not placed[index + size] and not queued[index + size]:
+                queued[index + size] = 1
+                queue.append(index + size)
+            if col != 0 and not placed[index - 1] and not queued[index - 1]:
+                queued[index - 1] = 1
+                queue.append(index - 1)
+            if col != size - 1 and not placed[index + 1] and not queued[index + 1]:
+                queued[index + 1] = 1
+                queue.append(index + 1)
 
     def get_remaining_cells_count(self):
         """Devolve o número de células que ainda não foram preenchidas."""
         return len(self.remaining_cells)
 
     def get_next_cell(self):
-        """Devolve a próxima célula a preencher."""
-        if (self.remaining_cells):
-            return self.remaining_cells[0]
+        """Devolve a próxima célula a preencher: a que tem menos
+        possibilidades."""
+        if self.order is None:
+            index = self.remaining_cells.first()
+        else:
+            index = self.order.next_cell(self.remaining_cells)
+        if index is not None:
+            return divmod(index, self.size)
 
     def get_possibilities_for_cell(self, row, col):
         """Devolve as possibilidades para a célula especificada."""
-        if not self.possible_values[row]:  # Check if the tuple is empty
-            return ()
-        return self.possible_values[row][col]
+        index = row * self.size + col
+        values = domain_values[piece_family[self.cells[index]]][self.domains[index]]
+        return values if self.order is None else self.order.order_values(values)
 
     def get_surrounding_placed_cells(self, row, col):
-        """Devolve as peças colocadas nas posições adjacentes."""
-        """top, bottom, left, right"""
-        surrounding_placed_pieces = [None, None, None, None]
-
-        if self.remaining_cells:
-            if row != 0 and (row - 1, col) not in self.remaining_cells:
-                surrounding_placed_pieces[0] = self.get_value(row - 1, col)
-
-            if row != self.size - 1 and (row + 1, col) not in self.remaining_cells:
-                surrounding_placed_pieces[1] = self.get_value(row + 1, col)
-
-            if col != 0 and (row, col - 1) not in self.remaining_cells:
-                surrounding_placed_pieces[2] = self.get_value(row, col - 1)
-
-            if col != self.size - 1 and (row, col + 1) not in self.remaining_cells:
-                surrounding_placed_pieces[3] = self.get_value(row, col + 1)
+        """Devolve o índice, em orientation_table, dos estados dos lados da
+        célula impostos pelos domínios das posições adjacentes (uma peça
+        colocada tem uma única possibilidade) e pelos limites do tabuleiro."""
+        cells, domains, size = self.cells, self.domains, self.size
+        index = row * size + col
+
+        # Two closing pieces connected to each other would form an isolated
+        # pair, so for a closing piece a closing neighbor is a blocked side
+        closing = piece_family[cells[index]] == CLOSING
+        state = 0
+
+        if row == 0:
+            state += BLOCKED * side_weights[UP]
+        else:
+            family = piece_family[cells[index - size]]
+            always, sometimes = domain_sides[family][domains[index - size]]
+            if not sometimes & DOWN or (closing and family == CLOSING):
+                state += BLOCKED * side_weights[UP]
+            elif always & DOWN:
+                state += CONNECTED * side_weights[UP]
+
+        if row == size - 1:
+            state += BLOCKED * side_weights[DOWN]
+        else:
+            family = piece_family[cells[index + size]]
+            always, sometimes = domain_sides[family][domains[index + size]]
+            if not sometimes & UP or (closing and family == CLOSING):
+                state += BLOCKED * side_weights[DOWN]
+            elif always & UP:
+                state += CONNECTED * side_weights[DOWN]
+
+        if col == 0:
+            state += BLOCKED * side_weights[LEFT]
+        else:
+            family = piece_family[cells[index - 1]]
+            always, sometimes = domain_sides[family][domains[index - 1]]
+            if not sometimes & RIGHT or (closing and family == CLOSING):
+                state += BLOCKED * side_weights[LEFT]
+            elif always & RIGHT:
+                state += CONNECTED * side_weights[LEFT]
+
+        if col == size - 1:
+            state += BLOCKED * side_weights[RIGHT]
+        else:
+            family = piece_family[cells[index + 1]]
+            always, sometimes = domain_sides[family][domains[index + 1]]
+            if not sometimes & LEFT or (closing and family == CLOSING):
+                state += BLOCKED * side_weights[RIGHT]
+            elif always & LEFT:
+                state += CONNECTED * side_weights[RIGHT]
 
-        return surrounding_placed_pieces
+        return state
 
     def get_adjacent_connected(self, row, col):
         """Devolve as células adjacentes conectadas."""
         connected = []
-        piece = self.get_value(row, col)
+        piece = self.cells[row * self.size + col]
 
-        if row != 0 and piece in connection["up"]:
+        if row != 0 and piece & UP:
             connected.append((row - 1, col))
-        if row != self.size - 1 and piece in connection["down"]:
+        if row != self.size - 1 and piece & DOWN:
             connected.append((row + 1, col))
 
-        if col != 0 and piece in connection["left"]:
+        if col != 0 and piece & LEFT:
             connected.append((row, col - 1))
-        if col != self.size - 1 and piece in connection["right"]:
+        if col != self.size - 1 and piece & RIGHT:
             connected.append((row, col + 1))
 
-        return [cell for cell in connected if cell not in self.remaining_cells]
+        return [(r, c) for r, c in connected if self.placed[r * self.size + c]]
 
     def __repr__(self):
-        return "\n".join(map(lambda x: "\t".join(map(str, x)), self.cells))
+        return "\n".join("\t".join(self.get_row(row)) for row in range(self.size))
 
     @ staticmethod
-    def parse_instance():
+    def parse_instance(stats: SolverStats = None):
         """Lê o test do standard input (stdin) que é passado como argumento
         e retorna uma instância da classe Board.
 
@@ -225,111 +734,52 @@ class Board:
             > from sys import stdin
             > line = stdin.readline().split()
         """
-
-        # Read data from stdin and convert it into a NumPy array
-        cells = [tuple(line.strip("\n").split('\t')) for line in sys.stdin]
-        return Board(tuple(cells)).calculate_state()
-
-    def actions_for_closing_piece(self, row, col, surrounding_placed_pieces):
-        """Devolve as ações possíveis para uma peça de fecho."""
-
-        # Check for surrounding pieces that have a connection
-        if surrounding_placed_pieces[0] in closing_connection["down"]:
-            return ("FC",)
-        if surrounding_placed_pieces[1] in closing_connection["up"]:
-            return ("FB",)
-        if surrounding_placed_pieces[2] in closing_connection["right"]:
-            return ("FE",)
-        if surrounding_placed_pieces[3] in closing_connection["left"]:
-            return ("FD",)
-
-        actions = ["FC", "FB", "FE", "FD"]
-
-        # Check for surrounding pieces that don't have a connection
-        if row == 0 or surrounding_placed_pieces[0] in no_connection("down"):
-            actions.remove("FC")
-        if row == self.size - 1 or surrounding_placed_pieces[1] in no_connection("up"):
-            actions.remove("FB")
-        if col == 0 or surrounding_placed_pieces[2] in no_connection("right"):
-            actions.remove("FE")
-        if col == self.size - 1 or surrounding_placed_pieces[3] in no_connection("left"):
-            actions.remove("FD")
-
-        return tuple(actions)
-
-    def actions_for_bifurcation_piece(self, row, col, surrounding_placed_pieces):
-        """Devolve as ações possíveis para uma peça de bifurcação."""
-
-        # Check for surrounding pieces that don't have a connection
-        if row == 0 or surrounding_placed_pieces[0] in no_connection("down"):
-            return ("BB",)
-        if row == self.size - 1 or surrounding_placed_pieces[1] in no_connection("up"):
-            return ("BC",)
-        if col == 0 or surrounding_placed_pieces[2] in no_connection("right"):
-            return ("BD",)
-        if col == self.size - 1 or surrounding_placed_pieces[3] in no_connection("left"):
-            return ("BE",)
-
-        actions = ["BC", "BB", "BE", "BD"]
-
-        # Check for surrounding pieces that have a connection
-        if surrounding_placed_pieces[0] in connection["down"]:
-            actions.remove("BB")
-        if surrounding_placed_pieces[1] in connection["up"]:
-            actions.remove("BC")
-        if surrounding_placed_pieces[2] in connection["right"]:
-            actions.remove("BD")
-        if surrounding_placed_pieces[3] in connection["left"]:
-            actions.remove("BE")
-
-        return tuple(actions)
-
-    def actions_for_corner_piece(self, row, col, surrounding_placed_pieces):
-        """Devolve as ações possíveis para uma peça de canto."""
-        actions = ["VC", "VB", "VE", "VD"]
-
-        if row == 0 or surrounding_placed_pieces[0] in no_connection("down") or surrounding_placed_pieces[1] in connection["up"]:
-            actions.remove("VC") if "VC" in actions else None
-            actions.remove("VD") if "VD" in actions else None
-        if row == self.size - 1 or surrounding_placed_pieces[1] in no_connection("up") or surrounding_placed_pieces[0] in connection["down"]:
-            actions.remove("VB") if "VB" in actions else None
-            actions.remove("VE") if "VE" in actions else None
-
-        if col == 0 or surrounding_placed_pieces[2] in no_connection("right") or surrounding_placed_pieces[3] in connection["left"]:
-            actions.remove("VE") if "VE" in actions else None
-            actions.remove("VC") if "VC" in actions else None
-
-        if col == self.size - 1 or surrounding_placed_pieces[3] in no_connection("left") or surrounding_placed_pieces[2] in connection["right"]:
-            actions.remove("VB") if "VB" in actions else None
-            actions.remove("VD") if "VD" in actions else None
-
-        return tuple(actions)
-
-    def actions_for_straight_piece(self, row, col, surrounding_placed_pieces):
-        """Devolve as ações possíveis para uma peça reta."""
-        actions = ["LV", "LH"]
-
-        if row == 0 or row == self.size - 1 or surrounding_placed_pieces[0] in no_connection("down") or surrounding_placed_pieces[1] in no_connection("up") or surrounding_placed_pieces[2] in connection["right"] or surrounding_placed_pieces[3] in connection["left"]:
-            actions.remove("LV")
-
-        if col == 0 or col == self.size - 1 or surrounding_placed_pieces[0] in connection["down"] or surrounding_placed_pieces[1] in connection["up"] or surrounding_placed_pieces[2] in no_connection("right") or surrounding_placed_pieces[3] in no_connection("left"):
-            actions.remove("LH")
-
-        return tuple(actions)
+        return Board.parse_lines(sys.stdin, stats)
+
+    @staticmethod
+    def parse_lines(lines, stats: SolverStats = None):
+        """Cria uma instância da classe Board a partir das linhas de um
+        tabuleiro no formato do stdin (peças separadas por tabs). Se for
+        dado um SolverStats, a propagação inicial é contada nele."""
+        cells, size = Board.read_cells(lines)
+        board = Board(cells, size)
+        board.stats = stats
+        return board.calculate_state()
+
+    @staticmethod
+    def read_cells(lines) -> tuple:
+        """Lê as linhas de um tabuleiro no formato do stdin. Devolve as
+        máscaras das peças, uma por célula e linha a linha, e o tamanho."""
+        cells = bytearray()
+        size = 0
+        for line in lines:
+            line = line.strip("\r\n")
+            if line:
+                cells.extend(piece_masks[piece] for piece in line.split('\t'))
+                size += 1
+        return cells, size
+
+    @staticmethod
+    def from_cells(cells, size: int, stats: SolverStats = None):
+        """Cria uma instância da classe Board a partir das máscaras das
+        peças, como as de read_cells. As máscaras são copiadas."""
+        board = Board(bytearray(cells), size)
+        board.stats = stats
+        return board.calculate_state()
+
+    @staticmethod
+    def format_cells(cells, size: int) -> str:
+        """Devolve as peças com as máscaras dadas no formato do stdin."""
+        return "\n".join("\t".join(map(piece_codes.get, cells[start:start + size]))
+                         for start in range(0, size * size, size))
 
     def actions_for_cell(self, row, col):
-        """Devolve as ações possíveis para a célula especificada."""
-        piece = self.get_value(row, col)
-        surrounding_placed_pieces = self.get_surrounding_placed_cells(row, col)
-
-        if piece[0] == "F":
-            return self.actions_for_closing_piece(row, col, surrounding_placed_pieces)
-        elif piece[0] == "B":
-            return self.actions_for_bifurcation_piece(row, col, surrounding_placed_pieces)
-        elif piece[0] == "V":
-            return self.actions_for_corner_piece(row, col, surrounding_placed_pieces)
-        else:
-            return self.actions_for_straight_piece(row, col, surrounding_placed_pieces)
+        """Devolve as ações possíveis para a célula especificada, como uma
+        máscara de orientações."""
+        if self.stats is not None:
+            self.stats.actions_for_cell += 1
+        family = piece_family[self.cells[row * self.size + col]]
+        return orientation_table[family][self.get_surrounding_placed_cells(row, col)]
 
     def is_connected(self):
         """Verifica se o tabuleiro não tem partições."""
@@ -344,20 +794,250 @@ class Board:
         return all(all(row) for row in visited)
 
 
+class EdgeBoard(Registered):
+    """Modelo alternativo de um tabuleiro de PipeMania, em que as variáveis
+    são as ligações entre células adjacentes (abertas ou fechadas).
+
+    As arestas horizontais (entre (r, c) e (r, c + 1)) são numeradas
+    r * (size - 1) + c e as verticais (entre (r, c) e (r + 1, c)) a seguir
+    a essas, size * (size - 1) + r * size + c. A família de cada peça
+    restringe as combinações das suas quatro arestas: o domínio de cada
+    célula é revisto com orientation_table a partir do estado das arestas e
+    uma aresta fica decidida quando todas as orientações possíveis de uma
+    das suas células concordam."""
+
+    def __init__(self, cells: bytearray, size: int):
+        """Construtor da classe."""
+        self.cells = cells
+        self.size = size
+        self.edges = bytearray(2 * size * (size - 1))
+        self.domains = bytearray(len(cells))
+        self.remaining_cells = CellScheduler(len(cells))
+        self.remaining_edges = len(self.edges)
+        self.invalid = False
+        self.cell_edges = self.build_cell_edges()
+        self.stats = None
+        self.register()
+
+    def build_cell_edges(self) -> tuple:
+        """Devolve, para cada célula, as arestas (UP, DOWN, LEFT, RIGHT), com
+        -1 nos lados da borda."""
+        size = self.size
+        vertical = size * (size - 1)
+        cell_edges = []
+        for row in range(size):
+            for col in range(size):
+                cell_edges.append((
+                    vertical + (row - 1) * size + col if row != 0 else -1,
+                    vertical + row * size + col if row != size - 1 else -1,
+                    row * (size - 1) + col - 1 if col != 0 else -1,
+                    row * (size - 1) + col if col != size - 1 else -1,
+                ))
+        return tuple(cell_edges)
+
+    @staticmethod
+    def from_board(board: Board) -> 'EdgeBoard':
+        """Cria o modelo de arestas das peças de um Board."""
+        edge_board = EdgeBoard(bytearray(board.cells), board.size)
+        return edge_board.calculate_state()
+
+    def calculate_state(self):
+        """Calcula o estado interno do tabuleiro para ser usado no tabuleiro
+        inicial."""
+        for index, piece in enumerate(self.cells):
+            domain = full_domain[piece_family[piece]]
+            self.domains[index] = domain
+            self.remaining_cells.add(index, domain_size[domain])
+
+        # Two closing pieces can't be connected to each other
+        size = self.size
+        for index, piece in enumerate(self.cells):
+            if piece_family[piece] != CLOSING:
+                continue
+            _, down, _, right = self.cell_edges[index]
+            if down != -1 and piece_family[self.cells[index + size]] == CLOSING:
+                self.set_edge(down, CLOSED_EDGE)
+            if right != -1 and piece_family[self.cells[index + 1]] == CLOSING:
+                self.set_edge(right, CLOSED_EDGE)
+
+        self.propagate(list(range(len(self.cells))))
+        return self
+
+    def copy(self) -> 'EdgeBoard':
+        """Devolve uma cópia do tabuleiro."""
+        new_board = EdgeBoard.__new__(EdgeBoard)
+        new_board.cells = self.cells
+        new_board.size = self.size
+        new_board.edges = bytearray(self.edges)
+        new_board.domains = bytearray(self.domains)
+        new_board.remaining_cells = self.remaining_cells.copy()
+        new_board.remaining_edges = self.remaining_edges
+        new_board.invalid = self.invalid
+        new_board.cell_edges = self.cell_edges
+        new_board.stats = self.stats
+        new_board.register()
+        return new_board
+
+    def edge_cells(self, edge: int) -> tuple:
+        """Devolve as duas células ligadas pela aresta."""
+        size = self.size
+        vertical = size * (size - 1)
+        if edge < vertical:
+            row, col = divmod(edge, size - 1)
+            return row * size + col, row * size + col + 1
+        return edge - vertical, edge - vertical + size
+
+    def set_edge(self, edge: int, value: int):
+        """Decide o estado de uma aresta, sem propagar."""
+        self.edges[edge] = value
+        self.remaining_edges -= 1
+
+    def place_edge(self, edge: int, value: int) -> 'EdgeBoard':
+        """Devolve uma cópia do tabuleiro com a aresta decidida e as
+        restrições propagadas."""
+        new_board = self.copy()
+        new_board.set_edge(edge, value)
+        new_board.propagate(list(new_board.edge_cells(edge)))
+        if not new_board.invalid and any(map(new_board.is_closed_component,
+                                             new_board.edge_cells(edge))):
+            new_board.invalid = True
+        return new_board
+
+    def is_closed_component(self, start: int) -> bool:
+        """Verifica se a componente ligada pelas arestas abertas a que a
+        célula start pertence já não tem arestas por decidir, sem cobrir
+        todo o tabuleiro."""
+        visited = {start}
+        stack = [start]
+        while stack:
+            index = stack.pop()
+            for edge in self.cell_edges[index]:
+                if edge == -1 or self.edges[edge] == CLOSED_EDGE:
+                    continue
+                if self.edges[edge] == UNKNOWN_EDGE:
+                    return False
+                for other in self.edge_cells(edge):
+                    if other not in visited:
+                        visited.add(other)
+                        stack.append(other)
+        return len(visited) < len(self.cells)
+
+    def get_surrounding_edges(self, index: int) -> int:
+        """Devolve o índice, em orientation_table, dos estados das arestas
+        da célula."""
+        edges = self.edges
+        state = 0
+        for edge, side in zip(self.cell_edges[index], SIDES):
+            if edge == -1 or edges[edge] == CLOSED_EDGE:
+                state += BLOCKED * side_weights[side]
+            elif edges[edge] == OPEN_EDGE:
+                state += CONNECTED * side_weights[side]
+        return state
+
+    def propagate(self, queue: list):
+        """Revê os domínios das células em queue e as suas arestas até não
+        haver alterações (ou até um domínio ficar vazio)."""
+        cells, domains, edges = self.cells, self.domains, self.edges
+        while queue:
+            index = queue.pop()
+            family = piece_family[cells[index]]
+            domain = domains[index] & orientation_table[family][self.get_surrounding_edges(index)]
+            if domain == 0:
+                self.invalid = True
+                if self.stats is not None:
+                    self.stats.wipeouts += 1
+                return
+            if domain != domains[index]:
+                domains[index] = domain
+                if domain_size[domain] == 1:
+                    self.remaining_cells.remove(index)
+                else:
+                    self.remaining_cells.update(index, domain_size[domain])
+
+            # Decide the edges on which every orientation agrees
+            always, sometimes = domain_sides[family][domain]
+            for edge, side in zip(self.cell_edges[index], SIDES):
+                if edge == -1 or edges[edge] != UNKNOWN_EDGE:
+                    continue
+                if always & side:
+                    self.set_edge(edge, OPEN_EDGE)
+                elif not sometimes & side:
+                    self.set_edge(edge, CLOSED_EDGE)
+                else:
+                    continue
+                a, b = self.edge_cells(edge)
+                queue.append(b if a == index else a)
+
+    def get_next_edge(self):
+        """Devolve uma aresta por decidir de uma das células com menos
+        possibilidades, ou None se já estiverem todas decididas."""
+        index = self.remaining_cells.first()
+        if index is None:
+            return None
+        for edge in self.cell_edges[index]:
+            if edge != -1 and self.edges[edge] == UNKNOWN_EDGE:
+                return edge
+
+    def get_remaining_cells_count(self):
+        """Devolve o número de células com mais de uma possibilidade."""
+        return len(self.remaining_cells)
+
+    def is_connected(self):
+        """Verifica se as arestas abertas ligam todas as células."""
+        visited = bytearray(len(self.cells))
+        visited[0] = 1
+        stack = [0]
+        while stack:
+            index = stack.pop()
+            for edge in self.cell_edges[index]:
+                if edge != -1 and self.edges[edge] == OPEN_EDGE:
+                    for other in self.edge_cells(edge):
+                        if not visited[other]:
+                            visited[other] = 1
+                            stack.append(other)
+        return all(visited)
+
+    def get_value(self, row: int, col: int) -> str:
+        """Devolve o valor na respetiva posição do tabuleiro: a peça
+        orientada, se já estiver decidida."""
+        index = row * self.size + col
+        values = domain_values[piece_family[self.cells[index]]][self.domains[index]]
+        return piece_codes[values[0] if len(values) == 1 else self.cells[index]]
+
+    def __repr__(self):
+        return "\n".join("\t".join(self.get_value(row, col) for col in range(self.size))
+                         for row in range(self.size))
+
+
 class PipeMania(Problem):
-    def __init__(self, board: Board):
-        """O construtor especifica o estado inicial."""
+    def __init__(self, board: Board, model: str = "cell", stats: SolverStats = None):
+        """O construtor especifica o estado inicial. No modelo "cell" as
+        ações orientam células; no modelo "edge" decidem arestas de um
+        EdgeBoard. Se for dado um SolverStats, a procura é contada nele."""
+        self.model = model
+        self.stats = stats
+        if model == "edge":
+            board = EdgeBoard.from_board(board)
+        board.stats = stats
         state = PipeManiaState(board)
         super().__init__(state)
-        pass
 
     def actions(self, state: PipeManiaState):
         """Retorna uma lista de ações que podem ser executadas a
         partir do estado passado como argumento."""
-        if state.board.invalid or not state.board.get_next_cell():
+        if self.stats is not None:
+            self.stats.nodes_expanded += 1
+        if self.model == "edge":
+            edge = None if state.board.invalid else state.board.get_next_edge()
+            if edge is None:
+                return []
+            return [(edge, CLOSED_EDGE), (edge, OPEN_EDGE)]
+
+        cell = None if state.board.invalid else state.board.get_next_cell()
+        if cell is None:
             return []
 
-        row, col = state.board.get_next_cell()
+        row, col = cell
 
         possibilities = state.board.get_possibilities_for_cell(row, col)
 
@@ -368,22 +1048,463 @@ class PipeMania(Problem):
         'state' passado como argumento. A ação a executar deve ser uma
         das presentes na lista obtida pela execução de
         self.actions(state)."""
-        (row, col, piece) = action
-        return PipeManiaState(state.board.place_piece(row, col, piece))
+        if self.model == "edge":
+            (edge, value) = action
+            new_state = PipeManiaState(state.board.place_edge(edge, value), state.depth + 1)
+        else:
+            (row, col, piece) = action
+            new_state = PipeManiaState(state.board.place_piece(row, col, piece), state.depth + 1)
+
+        if self.stats is not None:
+            self.count_generated(new_state.board, new_state.depth)
+        return new_state
 
     def goal_test(self, state: PipeManiaState):
         """Retorna True se e só se o estado passado como argumento é
         um estado objetivo. Deve verificar se todas as posições do tabuleiro
         estão preenchidas de acordo com as regras do problema."""
-        return state.board.get_remaining_cells_count() == 0 and state.board.is_connected()
+        board = state.board
+        if self.model == "edge":
+            return not board.invalid and board.remaining_edges == 0 \
+                and board.is_connected()
+
+        # Closed components are rejected as pieces are placed, so a full
+        # board is connected if it has a single component
+        return not board.invalid and board.get_remaining_cells_count() == 0 \
+            and board.components == 1
+
+    def apply(self, state: PipeManiaState, action):
+        """Executa a 'action' sobre o tabuleiro de 'state', alterando-o no
+        lugar. As alterações podem ser desfeitas com state.board.undo."""
+        (row, col, piece) = action
+        state.board.set_piece(row, col, piece)
+        if self.stats is not None:
+            self.count_generated(state.board)
+
+    def count_generated(self, board, depth: int = None):
+        """Conta um estado gerado pela procura. As procuras no lugar
+        registam elas próprias a profundidade."""
+        stats = self.stats
+        stats.nodes_generated += 1
+        stats.board = board
+        if board.invalid:
+            stats.backtracks += 1
+        if depth is not None:
+            stats.depth = depth
+            if depth > stats.max_depth:
+                stats.max_depth = depth
 
     def h(self, node: Node):
         """Função heuristica utilizada para a procura A*."""
         pass
 
 
+def depth_first_trail_search(problem: PipeMania):
+    """Procura em profundidade sobre um único tabuleiro, alterado no lugar
+    com PipeMania.apply. Ao retroceder, as alterações são desfeitas a partir
+    do rasto do tabuleiro, pelo que a memória usada é proporcional à
+    profundidade da procura e não ao tamanho da fronteira."""
+    state = problem.initial
+    board = state.board
+    if board.invalid:
+        return None
+    if problem.goal_test(state):
+        return Node(state)
+
+    stats = problem.stats
+
+    # Each entry holds the trail mark to return to and the untried actions
+    stack = [(len(board.trail), iter(problem.actions(state)))]
+    if stats is not None:
+        stats.frontier = stack
+    while stack:
+        mark, actions = stack[-1]
+        board.undo(mark)
+        action = next(actions, None)
+        if action is None:
+            stack.pop()
+            continue
+
+        problem.apply(state, action)
+        if stats is not None:
+            stats.depth = len(stack)
+            if stats.depth > stats.max_depth:
+                stats.max_depth = stats.depth
+        if board.invalid:
+            continue
+        if problem.goal_test(state):
+            return Node(state)
+        stack.append((len(board.trail), iter(problem.actions(state))))
+
+    return None
+
+
+def backjumping_search(problem: PipeMania, donor=None):
+    """Procura em profundidade no lugar, como depth_first_trail_search, mas
+    com retrocesso dirigido por conflitos (conflict-directed backjumping).
+
+    Cada nível da pilha é uma decisão. Quando um ramo falha, o tabuleiro
+    indica os níveis de decisão que explicam o conflito; esgotadas as
+    opções de um nível, a procura volta diretamente ao nível mais profundo
+    entre os responsáveis, e as decisões responsáveis são aprendidas como
+    um nogood para não voltarem a ser tentadas em conjunto.
+
+    Se for dado um donor, a cada DONATE_INTERVAL decisões a procura
+    pergunta-lhe (donor.wanted()) se quer trabalho e, se quiser, entrega-lhe
+    (donor.give(prefix, actions)) as ações por tentar do nível mais alto
+    que as tenha, com as ações que levam a esse nível. Essas ações deixam
+    de ser procuradas aqui (ver parallel.py)."""
+    state = problem.initial
+    board = state.board
+    if board.invalid:
+        return None
+    if problem.goal_test(state):
+        return Node(state)
+    stats = problem.stats
+
+    def new_frame():
+        """Cria o nível seguinte: [marca no rasto, ações por tentar,
+        célula, peça colocada, níveis responsáveis pelos conflitos]."""
+        row, col = board.get_next_cell()
+        return [len(board.trail), iter(problem.actions(state)),
+                row * board.size + col, None, 0]
+
+    def donate():
+        """Entrega a donor as ações por tentar do nível mais alto que as
+        tenha."""
+        for number, frame in enumerate(stack):
+            actions = list(frame[1])
+            if not actions:
+                continue
+            frame[1] = iter(())
+            # The actions given away weren't tried here, so running out of
+            # pieces at this level is blamed on every decision above it
+            frame[4] |= (1 << number + 1) - 2
+            donor.give([divmod(other[2], board.size) + (other[3],) for other in stack[:number]],
+                       actions)
+            return
+
+    stack = [new_frame()]
+    if stats is not None:
+        stats.frontier = stack
+    decisions = 0
+    while stack:
+        frame = stack[-1]
+        level = len(stack)
+        board.undo(frame[0])
+        action = next(frame[1], None)
+
+        if action is None:
+            # Every piece failed: blame the conflicts and whatever removed
+            # the other pieces from the cell's domain
+            stack.pop()
+            conflict = (frame[4] | board.reasons[frame[2]]) & ~(1 << level)
+            board.learn(tuple((stack[other - 1][2], stack[other - 1][3])
+                              for other in range(1, level) if conflict >> other & 1))
+
+            # Jump back to the deepest decision involved in the conflict
+            while stack and not conflict >> len(stack) & 1:
+                stack.pop()
+            if stack:
+                stack[-1][4] |= conflict
+            continue
+
+        board.level = level
+        frame[3] = action[2]
+        problem.apply(state, action)
+        if stats is not None:
+            stats.depth = level
+            if level > stats.max_depth:
+                stats.max_depth = level
+        if board.invalid:
+            frame[4] |= board.conflict
+            if not board.conflict >> level & 1:
+                # The conflict doesn't depend on this decision, so the other
+                # pieces would fail in the same way
+                frame[1] = iter(())
+            continue
+        if problem.goal_test(state):
+            return Node(state)
+        stack.append(new_frame())
+
+        if donor is not None:
+            decisions += 1
+            if decisions % DONATE_INTERVAL == 0 and donor.wanted():
+                donate()
+
+    return None
+
+
+def sat_search(problem: PipeMania):
+    """Resolve o problema com o resolvedor SAT de sat.py.
+
+    Cada orientação possível de cada célula é uma variável e cada célula
+    tem exatamente uma orientação. Os dois lados de cada ligação entre
+    células adjacentes têm de concordar e não pode haver ligações para fora
+    do tabuleiro. A conectividade é imposta de forma preguiçosa: enquanto o
+    modelo encontrado tiver várias componentes, acrescenta-se para cada uma
+    a cláusula que obriga a haver uma ligação para fora dela."""
+    # Only this engine needs the SAT solver, so it stays off the default path
+    from sat import Solver
+
+    board = problem.initial.board
+    if board.invalid:
+        return None
+    size = board.size
+    solver = Solver()
+
+    # Variables of each cell, as (piece, variable) pairs
+    variables = []
+    for index, piece in enumerate(board.cells):
+        values = domain_values[piece_family[piece]][board.domains[index]]
+        options = tuple((value, solver.new_var()) for value in values)
+        variables.append(options)
+        solver.add_clause([variable for _, variable in options])
+        for (_, a), (_, b) in itertools.combinations(options, 2):
+            solver.add_clause([-a, -b])
+
+    def connecting(index, side):
+        """Variáveis das orientações da célula index ligadas para side."""
+        return [variable for value, variable in variables[index] if value & side]
+
+    def neighbor(index, side):
+        """Devolve a célula adjacente do lado side, ou None na borda."""
+        row, col = divmod(index, size)
+        if side == UP:
+            return index - size if row != 0 else None
+        if side == DOWN:
+            return index + size if row != size - 1 else None
+        if side == LEFT:
+            return index - 1 if col != 0 else None
+        return index + 1 if col != size - 1 else None
+
+    for index, piece in enumerate(board.cells):
+        for side in SIDES:
+            other = neighbor(index, side)
+            if other is None or (piece_family[piece] == CLOSING
+                                 and piece_family[board.cells[other]] == CLOSING):
+                # No connection to the outside or between two closing pieces
+                for variable in connecting(index, side):
+                    solver.add_clause([-variable])
+            else:
+                # A connection needs a matching one on the other side
+                matching = connecting(other, OPPOSITE[side])
+                for variable in connecting(index, side):
+                    solver.add_clause([-variable] + matching)
+
+    while True:
+        model = solver.solve()
+        if problem.stats is not None:
+            problem.stats.nodes_expanded = problem.stats.nodes_generated = solver.decisions
+            problem.stats.backtracks = solver.conflicts
+        if model is None:
+            return None
+
+        cells = [next(value for value, variable in options if model[variable])
+                 for options in variables]
+
+        # Find the connected components of the model
+        component = [None] * len(cells)
+        components = []
+        for start in range(len(cells)):
+            if component[start] is not None:
+                continue
+            component[start] = len(components)
+            members = [start]
+            for index in members:
+                for side in SIDES:
+                    if cells[index] & side:
+                        other = neighbor(index, side)
+                        if component[other] is None:
+                            component[other] = len(components)
+                            members.append(other)
+            components.append(members)
+
+        if len(components) == 1:
+            break
+
+        # Each component must connect to a cell outside of it
+        for number, members in enumerate(components):
+            clause = []
+            for index in members:
+                for side in SIDES:
+                    other = neighbor(index, side)
+                    if other is not None and component[other] != number:
+                        clause.extend(connecting(index, side))
+            if not solver.add_clause(clause):
+                return None
+
+    return Node(PipeManiaState(board.with_pieces(cells)))
+
+
+def frontier_search(problem: PipeMania):
+    """Resolve o problema por programação dinâmica, percorrendo o tabuleiro
+    linha a linha, uma célula de cada vez.
+
+    Cada estado da fronteira guarda, para cada coluna, a componente da
+    ligação vertical que atravessa a fronteira (0 se estiver fechada) e
+    também a componente da ligação horizontal para a célula seguinte. As
+    componentes são renumeradas pela ordem em que aparecem, para que
+    estados equivalentes coincidam. Estados incompatíveis com a célula
+    seguinte, ou em que uma componente fica fechada antes de cobrir o
+    tabuleiro, são descartados. A solução é reconstruída a partir dos
+    apontadores guardados para o estado anterior."""
+    board = problem.initial.board
+    if board.invalid:
+        return None
+    size = board.size
+    count = size * size
+
+    layer = {(0,) * (size + 1): None}
+    # For each cell, the back-pointers (previous state, piece) of each state
+    history = []
+    for index in range(count):
+        col = index % size
+        values = domain_values[piece_family[board.cells[index]]][board.domains[index]]
+        last = index == count - 1
+        next_layer = {}
+
+        for state in layer:
+            top, left = state[col], state[size]
+            for piece in values:
+                if bool(piece & UP) != bool(top) or bool(piece & LEFT) != bool(left):
+                    continue
+
+                labels = list(state)
+                if top and left:
+                    label = top
+                    if left != top:
+                        labels = [top if other == left else other for other in labels]
+                elif top or left:
+                    label = top or left
+                else:
+                    label = max(labels) + 1
+                labels[col] = label if piece & DOWN else 0
+                labels[size] = label if piece & RIGHT else 0
+
+                # A component without connections across the frontier is
+                # closed, which is only allowed for the whole board
+                if label not in labels and not (last and not any(labels)):
+                    continue
+
+                numbers = {}
+                new_state = tuple(numbers.setdefault(other, len(numbers) + 1) if other else 0
+                                  for other in labels)
+                if new_state not in next_layer:
+                    next_layer[new_state] = (state, piece)
+
+        if problem.stats is not None:
+            problem.stats.nodes_expanded += len(layer)
+            problem.stats.nodes_generated += len(next_layer)
+            problem.stats.max_depth = problem.stats.depth = index + 1
+            problem.stats.frontier = next_layer
+        if not next_layer:
+            return None
+        history.append(next_layer)
+        layer = next_layer
+
+    pieces = bytearray(count)
+    state = (0,) * (size + 1)
+    for index in reversed(range(count)):
+        state, pieces[index] = history[index][state]
+    return Node(PipeManiaState(board.with_pieces(pieces)))
+
+
+engines = {
+    "dfs": depth_first_trail_search,
+    "cbj": backjumping_search,
+    "sat": sat_search,
+    "frontier": frontier_search,
+    "tree": depth_first_tree_search,
+}
+
+
+def solve(board: Board, engine: str = "cbj", model: str = "cell", stats: SolverStats = None,
+          order: SearchOrder = None):
+    """Resolve o tabuleiro com a procura indicada. Devolve o tabuleiro
+    resolvido, ou None se não houver solução. Se for dado um SolverStats,
+    a procura é contada nele; se for dado um SearchOrder, as procuras que
+    escolhem células usam essa ordem."""
+    board.order = order
+    start = time.perf_counter()
+    goal_node = engines[engine](PipeMania(board, model, stats))
+    if stats is not None:
+        stats.search_time += time.perf_counter() - start
+    return goal_node.state.board if goal_node else None
+
+
 if __name__ == "__main__":
-    board = Board.parse_instance()
-    pipemania = PipeMania(board)
-    goal_node = depth_first_tree_search(pipemania)
-    print(goal_node.state.board)
+    parser = argparse.ArgumentParser(description="Resolve um tabuleiro de PipeMania lido do stdin.")
+    parser.add_argument("--engine", choices=engines, default=None,
+                        help="procura a usar (por omissão, cbj no modelo cell e "
+                             "tree no modelo edge)")
+    parser.add_argument("--model", choices=("cell", "edge"), default="cell",
+                        help="variáveis de decisão: orientações das células ou arestas")
+    parser.add_argument("--stats", nargs="?", const="-", metavar="FILE",
+                        help="acrescenta as estatísticas da resolução, como uma linha "
+                             "JSON, a FILE (por omissão, ao stderr)")
+    parser.add_argument("--profile", nargs="?", const="pipe", metavar="PREFIX",
+                        help="corre a leitura e a procura com o cProfile e guarda o perfil "
+                             "em PREFIX.pstats e PREFIX.collapsed (por omissão, PREFIX é pipe)")
+    parser.add_argument("--progress", nargs="?", type=float, const=5.0, metavar="SECONDS",
+                        help="escreve o progresso da procura no stderr a cada SECONDS "
+                             "segundos (por omissão, 5)")
+    parser.add_argument("--memory", nargs="?", const="-", metavar="FILE",
+                        help="mede a memória usada pela procura e acrescenta o relatório, "
+                             "como uma linha JSON, a FILE (por omissão, ao stderr)")
+    args = parser.parse_args()
+    if args.engine is None:
+        args.engine = "tree" if args.model == "edge" else "cbj"
+    if args.model == "edge" and args.engine != "tree":
+        parser.error("o modelo edge só pode ser usado com --engine tree")
+
+    stats = SolverStats() if args.stats is not None or args.progress or args.memory else None
+
+    def parse_and_solve():
+        start = time.perf_counter()
+        board = Board.parse_instance(stats)
+        if stats is not None:
+            stats.parse_time = time.perf_counter() - start
+        return board, solve(board, args.engine, args.model, stats)
+
+    if args.progress:
+        from progress import ProgressReporter
+        reporter = ProgressReporter(stats, args.progress)
+        reporter.start()
+    if args.memory:
+        from memory import MemoryReport
+        memory_report = MemoryReport(stats, (Board, EdgeBoard, PipeManiaState, Node))
+        memory_report.start()
+
+    if args.profile is None:
+        board, solution = parse_and_solve()
+    else:
+        import profiling
+        (board, solution), profile = profiling.profile_call(parse_and_solve)
+        profiling.write_profile(profile, args.profile)
+
+    if args.progress:
+        reporter.stop()
+    if args.memory:
+        memory_report.stop()
+
+    start = time.perf_counter()
+    print(solution, flush=True)
+    if stats is None:
+        sys.exit()
+    stats.output_time = time.perf_counter() - start
+
+    import json
+    reports = []
+    if args.stats is not None:
+        reports.append((args.stats, stats.as_dict()))
+    if args.memory is not None:
+        reports.append((args.memory, memory_report.as_dict()))
+    for path, report in reports:
+        record = {"engine": args.engine, "model": args.model, "size": board.size,
+                  "solved": solution is not None, **report}
+        if path == "-":
+            print(json.dumps(record), file=sys.stderr)
+        else:
+            with open(path, "a") as file:
+                file.write(json.dumps(record) + "\n")
@@ -0,0 +1,139 @@
+"""Resolve um tabuleiro de PipeMania com um portefólio de procuras: várias
+configurações da procura correm em processos separados, a primeira
+resposta é usada e os restantes processos são terminados.
+
+Por exemplo:
+    $ python3 portfolio.py < test-01.txt
+    $ python3 portfolio.py --config cbj:oldest:reverse --config sat < test-01.txt
+
+Os tempos de resolução variam muito com a ordem das células e das peças:
+uma ordem que resolve um tabuleiro de imediato pode demorar minutos no
+seguinte. Com várias ordens em paralelo, o tempo de cada tabuleiro fica
+próximo do da melhor configuração para esse tabuleiro.
+
+Cada configuração é ENGINE[:CELL_ORDER[:VALUE_ORDER[:SEED]]], com as
+ordens de pipe.SearchOrder. Todas as procuras são completas, pelo que a
+primeira a concluir que não há solução também serve de resposta.
+"""
+
+import argparse
+import multiprocessing
+import os
+import queue
+import sys
+
+from pipe import Board, SearchOrder, engines, solve
+
+DEFAULT_PORTFOLIO = (
+    ("cbj", "newest", "default", None),
+    ("cbj", "oldest", "reverse", None),
+    ("cbj", "random", "random", 1),
+    ("sat", "newest", "default", None),
+    ("cbj", "random", "default", 2),
+    ("cbj", "newest", "random", 3),
+    ("cbj", "oldest", "random", 4),
+    ("frontier", "newest", "default", None),
+)
+
+
+def parse_config(text: str) -> tuple:
+    """Lê uma configuração no formato ENGINE[:CELL_ORDER[:VALUE_ORDER[:SEED]]]."""
+    parts = text.split(":")
+    if not 1 <= len(parts) <= 4:
+        raise argparse.ArgumentTypeError(f"invalid configuration: {text!r}")
+    engine, cell_order, value_order, seed = parts + ["newest", "default", None][len(parts) - 1:]
+    if engine not in engines or engine == "tree":
+        raise argparse.ArgumentTypeError(f"invalid engine: {engine!r}")
+    if cell_order not in SearchOrder.cell_orders:
+        raise argparse.ArgumentTypeError(f"invalid cell order: {cell_order!r}")
+    if value_order not in SearchOrder.value_orders:
+        raise argparse.ArgumentTypeError(f"invalid value order: {value_order!r}")
+    return engine, cell_order, value_order, int(seed) if seed is not None else None
+
+
+def format_config(config: tuple) -> str:
+    engine, cell_order, value_order, seed = config
+    return ":".join([engine, cell_order, value_order] + ([str(seed)] if seed is not None else []))
+
+
+def run_config(board: Board, number: int, config: tuple, results):
+    """Resolve o tabuleiro com uma configuração e envia para results o
+    número da configuração e as peças da solução (None se não houver
+    solução), ou a mensagem de erro."""
+    engine, cell_order, value_order, seed = config
+    try:
+        solution = solve(board, engine, order=SearchOrder(cell_order, value_order, seed))
+    except Exception as error:
+        results.put((number, "error", repr(error)))
+        return
+    results.put((number, "done", bytes(solution.cells) if solution is not None else None))
+
+
+def solve_portfolio(board: Board, configs=DEFAULT_PORTFOLIO, timeout: float = None) -> tuple:
+    """Resolve o tabuleiro com uma procura por configuração, cada uma no
+    seu processo. Devolve o tabuleiro resolvido (ou None se não houver
+    solução) e a configuração que respondeu primeiro. Lança TimeoutError se
+    nenhuma responder no tempo indicado."""
+    if board.invalid or board.get_remaining_cells_count() == 0:
+        # Nothing left to search
+        return solve(board), configs[0]
+
+    context = multiprocessing.get_context()
+    results = context.Queue()
+    processes = [context.Process(target=run_config, args=(board, number, config, results),
+                                 daemon=True)
+                 for number, config in enumerate(configs)]
+    for process in processes:
+        process.start()
+
+    errors = []
+    try:
+        while len(errors) < len(processes):
+            try:
+                number, status, value = results.get(timeout=timeout)
+            except queue.Empty:
+                raise TimeoutError(f"no configuration finished in {timeout}s") from None
+            if status == "error":
+                errors.append(f"{format_config(configs[number])}: {value}")
+                continue
+            solution = board.with_pieces(value) if value is not None else None
+            return solution, configs[number]
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        for process in processes:
+            process.join()
+        results.close()
+
+    raise RuntimeError("every configuration failed: " + "; ".join(errors))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Resolve um tabuleiro de PipeMania lido do stdin "
+                                                 "com várias procuras em paralelo.")
+    parser.add_argument("--config", dest="configs", action="append", type=parse_config,
+                        metavar="ENGINE[:CELL[:VALUE[:SEED]]]",
+                        help="configuração a incluir no portefólio (pode ser repetida; "
+                             "por omissão, as primeiras --workers de DEFAULT_PORTFOLIO)")
+    parser.add_argument("--workers", type=int, default=max(4, os.cpu_count()),
+                        help="número de configurações do portefólio por omissão a usar "
+                             "(por omissão, uma por CPU e pelo menos 4: mesmo a partilhar "
+                             "um CPU, as restantes evitam os casos mais lentos da primeira)")
+    parser.add_argument("--timeout", type=float, default=None,
+                        help="tempo limite, em segundos")
+    parser.add_argument("--verbose", action="store_true",
+                        help="indica no stderr a configuração que respondeu primeiro")
+    args = parser.parse_args(argv)
+    configs = args.configs or DEFAULT_PORTFOLIO[:max(1, args.workers)]
+
+    board = Board.parse_instance()
+    solution, config = solve_portfolio(board, configs, args.timeout)
+    print(solution)
+    if args.verbose:
+        print(f"first answer from {format_config(config)}", file=sys.stderr)
+    return 0 if solution is not None else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
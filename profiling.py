@@ -0,0 +1,86 @@
+"""Perfis de execução com cProfile, guardados no formato do pstats e também
+como pilhas colapsadas (uma pilha por linha, com as funções separadas por
+";" e seguida do tempo em microssegundos), o formato lido pelo
+flamegraph.pl, pelo speedscope e por ferramentas semelhantes.
+
+O cProfile só regista o tempo de cada função e de cada par
+(chamadora, chamada), e não as pilhas completas. As pilhas são
+reconstruídas a partir do grafo de chamadas: o tempo de uma função é
+repartido pelas suas chamadoras na proporção do tempo que cada uma lhe
+atribui, o que é exato sempre que o tempo de uma função não depende de
+quem a chama.
+"""
+
+import cProfile
+import os
+import pstats
+
+# Paths contributing less than this many microseconds are dropped
+MIN_STACK_TIME = 1
+
+
+def function_label(function: tuple) -> str:
+    """Devolve o nome de uma função do pstats para uma pilha colapsada."""
+    filename, line, name = function
+    if filename == "~":
+        # Built-in functions
+        label = name
+    else:
+        label = f"{os.path.basename(filename)}:{line}:{name}"
+    return label.replace(";", ",")
+
+
+def collapsed_stacks(stats: pstats.Stats) -> dict:
+    """Devolve o tempo, em microssegundos, de cada pilha de chamadas
+    reconstruída a partir do grafo de chamadas."""
+    callees = {}
+    roots = []
+    for function, (_, _, _, _, callers) in stats.stats.items():
+        for caller, (_, _, _, cumulative, *_) in callers.items():
+            if caller in stats.stats:
+                callees.setdefault(caller, []).append((function, cumulative))
+        if not any(caller in stats.stats for caller in callers):
+            roots.append(function)
+
+    stacks = {}
+
+    def visit(function, share, path, labels):
+        """Atribui à pilha labels a fração share do tempo de function."""
+        _, _, inline, cumulative, _ = stats.stats[function]
+        time = inline * share * 1e6
+        if time >= MIN_STACK_TIME:
+            stack = ";".join(labels)
+            stacks[stack] = stacks.get(stack, 0) + time
+        for callee, edge_time in callees.get(function, ()):
+            # Recursive calls are already counted in the outer call
+            callee_total = stats.stats[callee][3]
+            if callee in path or not callee_total:
+                continue
+            callee_share = share * edge_time / callee_total
+            if callee_total * callee_share * 1e6 >= MIN_STACK_TIME:
+                path.add(callee)
+                labels.append(function_label(callee))
+                visit(callee, callee_share, path, labels)
+                labels.pop()
+                path.remove(callee)
+
+    for root in roots:
+        visit(root, 1.0, {root}, [function_label(root)])
+    return stacks
+
+
+def write_profile(stats: pstats.Stats, prefix: str):
+    """Guarda o perfil em prefix.pstats e as pilhas colapsadas em
+    prefix.collapsed."""
+    stats.dump_stats(prefix + ".pstats")
+    with open(prefix + ".collapsed", "w") as file:
+        for stack, time in sorted(collapsed_stacks(stats).items()):
+            file.write(f"{stack} {round(time)}\n")
+
+
+def profile_call(function, *args, **kwargs):
+    """Executa function(*args, **kwargs) com o cProfile. Devolve o resultado
+    e o perfil, como um pstats.Stats."""
+    profiler = cProfile.Profile()
+    result = profiler.runcall(function, *args, **kwargs)
+    return result, pstats.Stats(profiler)
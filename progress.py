@@ -0,0 +1,64 @@
+"""Relatório periódico do progresso de uma resolução, para distinguir uma
+procura lenta de uma procura bloqueada.
+
+Uma thread em segundo plano lê, a cada intervalo, os contadores de um
+SolverStats e escreve uma linha com os nós gerados por segundo, a
+profundidade atual e as células por preencher, o tamanho da fronteira e a
+taxa de retrocessos. A procura não faz qualquer verificação por nó: os
+contadores já são atualizados pelo SolverStats e só a thread consulta o
+relógio.
+"""
+
+import sys
+import threading
+import time
+
+
+class ProgressReporter:
+    """Escreve o progresso de stats a cada interval segundos, entre start e
+    stop. Também pode ser usado como gestor de contexto."""
+
+    def __init__(self, stats, interval: float = 5.0, file=None):
+        self.stats = stats
+        self.interval = interval
+        self.file = file if file is not None else sys.stderr
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="progress", daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def report(self, elapsed: float, interval: float, generated: int, backtracks: int):
+        """Escreve uma linha com o progresso do último intervalo."""
+        stats = self.stats
+        board = stats.board
+        remaining = board.get_remaining_cells_count() if board is not None else "?"
+        rate = generated / interval if interval else 0.0
+        backtrack_share = backtracks / generated if generated else 0.0
+        print(f"[{elapsed:7.1f}s] {stats.nodes_generated} nodes ({rate:.0f}/s), "
+              f"depth {stats.depth} (max {stats.max_depth}), {remaining} cells remaining, "
+              f"frontier {self.stats.frontier_size()}, "
+              f"backtracks {backtracks / interval if interval else 0.0:.0f}/s "
+              f"({backtrack_share:.0%} of new nodes)",
+              file=self.file, flush=True)
+
+    def run(self):
+        start = last = time.perf_counter()
+        last_generated = last_backtracks = 0
+        while not self.stopped.wait(self.interval):
+            now = time.perf_counter()
+            generated, backtracks = self.stats.nodes_generated, self.stats.backtracks
+            self.report(now - start, now - last,
+                        generated - last_generated, backtracks - last_backtracks)
+            last, last_generated, last_backtracks = now, generated, backtracks
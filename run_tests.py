@@ -2,6 +2,7 @@ import os
 import glob
 import subprocess
 import difflib
+import random
 
 # Clear the test_results.txt file
 open('test_results.txt', 'w').close()
@@ -46,3 +47,182 @@ for input_file in input_files:
 
     # Run the test
     run_test(input_file, expected_output_file)
+
+
+# The bundled puzzles are all solved by the initial propagation, so the
+# searches are also run on generated boards that need branching. Different
+# searches may find different solutions, so each output is checked to be a
+# solution of the puzzle instead of being compared with a file.
+
+# Connections of each piece: up, down, left and right
+CONNECTIONS = {
+    'FC': 'U', 'FB': 'D', 'FE': 'L', 'FD': 'R',
+    'BC': 'ULR', 'BB': 'DLR', 'BE': 'UDL', 'BD': 'UDR',
+    'VC': 'UL', 'VB': 'DR', 'VE': 'DL', 'VD': 'UR',
+    'LH': 'LR', 'LV': 'UD',
+}
+PIECES = {frozenset(connections): piece for piece, connections in CONNECTIONS.items()}
+DIRECTIONS = {'U': (-1, 0, 'D'), 'D': (1, 0, 'U'), 'L': (0, -1, 'R'), 'R': (0, 1, 'L')}
+
+# Engines and models to run on the generated boards
+ENGINE_OPTIONS = [
+    ['--engine', 'dfs'],
+    ['--engine', 'cbj'],
+    ['--engine', 'sat'],
+    ['--engine', 'frontier'],
+    ['--engine', 'tree'],
+    ['--model', 'edge'],
+]
+
+# (size, loops, seed) of the generated boards; the unsolvable ones have a
+# curve turned into a straight pipe, or the other way round
+SOLVABLE_BOARDS = [(12, 0, 3), (15, 0, 5), (20, 0, 1), (20, 6, 7)]
+UNSOLVABLE_BOARDS = [(10, 0, 222), (12, 0, 80), (12, 0, 290), (11, 4, 337)]
+
+
+def neighbours(size, row, col):
+    for direction, (d_row, d_col, opposite) in DIRECTIONS.items():
+        if 0 <= row + d_row < size and 0 <= col + d_col < size:
+            yield direction, row + d_row, col + d_col, opposite
+
+
+def generate_solution(size, rng, loops):
+    # A random spanning tree of the grid with at most 3 connections per
+    # cell, plus some extra connections that close loops
+    while True:
+        connections = [[set() for _ in range(size)] for _ in range(size)]
+        connected = {(0, 0)}
+        edges = [((0, 0),) + neighbour for neighbour in neighbours(size, 0, 0)]
+        while edges and len(connected) < size * size:
+            edge = edges.pop(rng.randrange(len(edges)))
+            (row, col), direction, other_row, other_col, opposite = edge
+            if (other_row, other_col) in connected or len(connections[row][col]) == 3:
+                continue
+            connections[row][col].add(direction)
+            connections[other_row][other_col].add(opposite)
+            connected.add((other_row, other_col))
+            edges += [((other_row, other_col),) + neighbour
+                      for neighbour in neighbours(size, other_row, other_col)]
+        if len(connected) == size * size:
+            break
+    for _ in range(loops):
+        row, col = rng.randrange(size), rng.randrange(size)
+        for direction, other_row, other_col, opposite in neighbours(size, row, col):
+            if (direction not in connections[row][col] and len(connections[row][col]) < 3
+                    and len(connections[other_row][other_col]) < 3):
+                connections[row][col].add(direction)
+                connections[other_row][other_col].add(opposite)
+                break
+    return [[PIECES[frozenset(cell)] for cell in row] for row in connections]
+
+
+def generate_board(size, loops, seed, solvable=True):
+    rng = random.Random(seed)
+    rows = generate_solution(size, rng, loops)
+    if not solvable:
+        row, col = rng.choice([(row, col) for row in range(size) for col in range(size)
+                               if rows[row][col][0] in 'VL'])
+        rows[row][col] = 'LH' if rows[row][col][0] == 'V' else 'VC'
+    # Turn every piece at random
+    families = {family: [piece for piece in CONNECTIONS if piece[0] == family] for family in 'FBVL'}
+    return [[rng.choice(families[piece[0]]) for piece in row] for row in rows]
+
+
+def is_solution(puzzle, rows):
+    size = len(puzzle)
+    if len(rows) != size or any(len(row) != size for row in rows):
+        return False
+    if any(piece not in CONNECTIONS or piece[0] != original[0]
+           for row, puzzle_row in zip(rows, puzzle) for piece, original in zip(row, puzzle_row)):
+        return False
+    for row in range(size):
+        for col in range(size):
+            connections = set(CONNECTIONS[rows[row][col]])
+            for direction, other_row, other_col, opposite in neighbours(size, row, col):
+                other_connections = CONNECTIONS[rows[other_row][other_col]]
+                if (direction in connections) != (opposite in other_connections):
+                    return False
+                connections.discard(direction)
+            # Left over: connections leaving the board
+            if connections:
+                return False
+    # Every cell is reached from the first one
+    reached = {(0, 0)}
+    pending = [(0, 0)]
+    while pending:
+        row, col = pending.pop()
+        for direction, other_row, other_col, _ in neighbours(size, row, col):
+            if direction in CONNECTIONS[rows[row][col]] and (other_row, other_col) not in reached:
+                reached.add((other_row, other_col))
+                pending.append((other_row, other_col))
+    return len(reached) == size * size
+
+
+def has_solution(puzzle):
+    # Plain backtracking over the cells in reading order, independent of
+    # pipe.py; only used on the unsolvable boards, where it stays quick
+    size = len(puzzle)
+    rows = [[None] * size for _ in range(size)]
+
+    def fits(row, col, piece):
+        connections = CONNECTIONS[piece]
+        if (row == 0 and 'U' in connections or row == size - 1 and 'D' in connections
+                or col == 0 and 'L' in connections or col == size - 1 and 'R' in connections):
+            return False
+        if row > 0 and ('U' in connections) != ('D' in CONNECTIONS[rows[row - 1][col]]):
+            return False
+        return col == 0 or ('L' in connections) == ('R' in CONNECTIONS[rows[row][col - 1]])
+
+    def search(cell):
+        if cell == size * size:
+            return is_solution(puzzle, rows)
+        row, col = divmod(cell, size)
+        for piece in CONNECTIONS:
+            if piece[0] == puzzle[row][col][0] and fits(row, col, piece):
+                rows[row][col] = piece
+                if search(cell + 1):
+                    return True
+        rows[row][col] = None
+        return False
+
+    return search(0)
+
+
+def run_engine_test(name, puzzle, solvable, options):
+    text = '\n'.join('\t'.join(row) for row in puzzle) + '\n'
+    result = subprocess.run(['/usr/bin/python3', 'pipe.py', *options], input=text.encode(),
+                            stdout=subprocess.PIPE)
+    output = result.stdout.decode()
+    rows = [line.split('\t') for line in output.splitlines()]
+    if solvable:
+        passed = result.returncode == 0 and is_solution(puzzle, rows)
+    else:
+        passed = result.returncode == 0 and output.strip() == 'None'
+    description = f'{name} with {" ".join(options)}'
+    if passed:
+        print(f'No difference found for {description}')
+        return
+    expected = 'a solution of the puzzle' if solvable else 'None (no solution)'
+    print(f'Difference found for {description}:')
+    print(f'Expected output: {expected}')
+    print('Actual output:')
+    print(output)
+    with open('test_results.txt', 'a') as file:
+        file.write(f'Difference found for {description}:\n')
+        file.write(f'Expected output: {expected}\n')
+        file.write('Puzzle:\n')
+        file.write(text)
+        file.write('Actual output:\n')
+        file.write(output + '\n')
+
+
+for boards, solvable in ((SOLVABLE_BOARDS, True), (UNSOLVABLE_BOARDS, False)):
+    for size, loops, seed in boards:
+        kind = 'board' if solvable else 'unsolvable board'
+        name = f'generated {size}x{size} {kind} (loops {loops}, seed {seed})'
+        puzzle = generate_board(size, loops, seed, solvable)
+        if not solvable and has_solution(puzzle):
+            print(f'The {name} has a solution; pick another seed')
+            continue
+        for options in ENGINE_OPTIONS:
+            run_engine_test(name, puzzle, solvable, options)
@@ -0,0 +1,287 @@
+"""Resolvedor SAT CDCL (conflict-driven clause learning) em Python.
+
+As variáveis são inteiros positivos criados com Solver.new_var e um literal
+é uma variável (verdadeira) ou o seu simétrico (falsa), como no formato
+DIMACS. As cláusulas podem ser acrescentadas entre chamadas a solve, o que
+permite acrescentar restrições de forma preguiçosa depois de ver um modelo.
+"""
+
+import heapq
+
+
+def luby(i):
+    """Devolve o i-ésimo termo (a começar em 1) da sequência de Luby."""
+    size, seq = 1, 0
+    while size < i + 1:
+        seq += 1
+        size = 2 * size + 1
+    while size - 1 != i:
+        size = (size - 1) >> 1
+        seq -= 1
+        i = i % size
+    return 2 ** seq
+
+
+class Solver:
+    """Resolvedor CDCL com literais vigiados (two watched literals),
+    aprendizagem de cláusulas pelo primeiro ponto de implicação único,
+    retrocesso não cronológico, heurística VSIDS com memória de fase e
+    reinícios segundo a sequência de Luby."""
+
+    restart_unit = 100
+    activity_decay = 0.95
+
+    def __init__(self):
+        self.num_vars = 0
+        self.clauses = []
+        # Clauses watching each literal, indexed by literal_index
+        self.watches = [[], []]
+        # 1 if true, -1 if false, 0 if unassigned, indexed by variable
+        self.values = [0]
+        self.levels = [0]
+        self.reasons = [None]
+        self.activity = [0.0]
+        self.phase = [True]
+        self.heap = []
+        self.activity_inc = 1.0
+        self.trail = []
+        self.trail_limits = []
+        self.propagated = 0
+        self.unsatisfiable = False
+        self.conflicts = 0
+        self.decisions = 0
+
+    def new_var(self) -> int:
+        """Cria uma nova variável e devolve-a."""
+        self.num_vars += 1
+        self.watches.append([])
+        self.watches.append([])
+        self.values.append(0)
+        self.levels.append(0)
+        self.reasons.append(None)
+        self.activity.append(0.0)
+        self.phase.append(True)
+        heapq.heappush(self.heap, (0.0, self.num_vars))
+        return self.num_vars
+
+    @staticmethod
+    def literal_index(literal: int) -> int:
+        return 2 * literal if literal > 0 else -2 * literal + 1
+
+    def value(self, literal: int) -> int:
+        """Devolve 1, -1 ou 0 se o literal é verdadeiro, falso ou ainda
+        não tem valor."""
+        value = self.values[abs(literal)]
+        return value if literal > 0 else -value
+
+    def add_clause(self, literals) -> bool:
+        """Acrescenta uma cláusula (disjunção de literais). Devolve False se
+        o problema passar a ser trivialmente impossível."""
+        if self.unsatisfiable:
+            return False
+        self.backtrack(0)
+
+        clause = []
+        for literal in literals:
+            value = self.value(literal)
+            if value == 1 or -literal in clause:
+                # Already satisfied at the top level, or a tautology
+                return True
+            if value == 0 and literal not in clause:
+                clause.append(literal)
+
+        if not clause:
+            self.unsatisfiable = True
+            return False
+        if len(clause) == 1:
+            self.assign(clause[0], None)
+            if self.propagate() is not None:
+                self.unsatisfiable = True
+                return False
+            return True
+
+        self.attach(clause)
+        return True
+
+    def attach(self, clause: list) -> int:
+        """Guarda a cláusula e vigia os seus dois primeiros literais."""
+        index = len(self.clauses)
+        self.clauses.append(clause)
+        self.watches[self.literal_index(clause[0])].append(index)
+        self.watches[self.literal_index(clause[1])].append(index)
+        return index
+
+    def assign(self, literal: int, reason):
+        variable = abs(literal)
+        self.values[variable] = 1 if literal > 0 else -1
+        self.levels[variable] = len(self.trail_limits)
+        self.reasons[variable] = reason
+        self.trail.append(literal)
+
+    def propagate(self):
+        """Propaga os literais atribuídos. Devolve o índice de uma cláusula
+        em conflito, ou None."""
+        clauses, watches, values = self.clauses, self.watches, self.values
+        literal_index = self.literal_index
+
+        while self.propagated < len(self.trail):
+            false_literal = -self.trail[self.propagated]
+            self.propagated += 1
+            watching = watches[literal_index(false_literal)]
+            kept = []
+            i = 0
+            while i < len(watching):
+                index = watching[i]
+                i += 1
+                clause = clauses[index]
+                if clause[0] == false_literal:
+                    clause[0], clause[1] = clause[1], false_literal
+
+                first = clause[0]
+                first_value = values[abs(first)] if first > 0 else -values[abs(first)]
+                if first_value == 1:
+                    kept.append(index)
+                    continue
+
+                # Look for a new literal to watch
+                for k in range(2, len(clause)):
+                    literal = clause[k]
+                    value = values[abs(literal)] if literal > 0 else -values[abs(literal)]
+                    if value != -1:
+                        clause[1], clause[k] = literal, false_literal
+                        watches[literal_index(literal)].append(index)
+                        break
+                else:
+                    kept.append(index)
+                    if first_value == -1:
+                        kept.extend(watching[i:])
+                        watches[literal_index(false_literal)] = kept
+                        return index
+                    self.assign(first, index)
+
+            watches[literal_index(false_literal)] = kept
+
+        return None
+
+    def analyze(self, conflict: int):
+        """Deriva do conflito uma cláusula aprendida cujo primeiro literal
+        é o único do último nível de decisão. Devolve a cláusula e o nível
+        para onde retroceder."""
+        levels, reasons = self.levels, self.reasons
+        level = len(self.trail_limits)
+        seen = set()
+        learnt = [None]
+        pending = 0
+        literal = None
+        position = len(self.trail) - 1
+        clause = self.clauses[conflict]
+
+        while True:
+            for other in (clause if literal is None else clause[1:]):
+                variable = abs(other)
+                if variable not in seen and levels[variable] > 0:
+                    seen.add(variable)
+                    self.bump(variable)
+                    if levels[variable] == level:
+                        pending += 1
+                    else:
+                        learnt.append(other)
+
+            # Walk back the trail to the next literal involved in the conflict
+            while abs(self.trail[position]) not in seen:
+                position -= 1
+            literal = self.trail[position]
+            position -= 1
+            pending -= 1
+            if pending == 0:
+                break
+            clause = self.clauses[reasons[abs(literal)]]
+
+        learnt[0] = -literal
+        backjump = 0
+        if len(learnt) > 1:
+            # Watch the literal with the highest level as the second one
+            deepest = max(range(1, len(learnt)), key=lambda i: levels[abs(learnt[i])])
+            learnt[1], learnt[deepest] = learnt[deepest], learnt[1]
+            backjump = levels[abs(learnt[1])]
+        return learnt, backjump
+
+    def bump(self, variable: int):
+        self.activity[variable] += self.activity_inc
+        if self.activity[variable] > 1e100:
+            self.activity = [activity * 1e-100 for activity in self.activity]
+            self.activity_inc *= 1e-100
+            self.heap = [(-self.activity[v], v) for v in range(1, self.num_vars + 1)
+                         if self.values[v] == 0]
+            heapq.heapify(self.heap)
+        elif self.values[variable] == 0:
+            heapq.heappush(self.heap, (-self.activity[variable], variable))
+
+    def backtrack(self, level: int):
+        """Desfaz as atribuições feitas acima do nível especificado."""
+        if len(self.trail_limits) <= level:
+            return
+        start = self.trail_limits[level]
+        for literal in self.trail[start:]:
+            variable = abs(literal)
+            self.values[variable] = 0
+            self.reasons[variable] = None
+            self.phase[variable] = literal > 0
+            heapq.heappush(self.heap, (-self.activity[variable], variable))
+        del self.trail[start:]
+        del self.trail_limits[level:]
+        self.propagated = min(self.propagated, start)
+
+    def decide(self) -> bool:
+        """Atribui um valor à variável mais ativa sem valor. Devolve False
+        se todas as variáveis já tiverem valor."""
+        heap = self.heap
+        while heap:
+            _, variable = heapq.heappop(heap)
+            if self.values[variable] == 0:
+                self.decisions += 1
+                self.trail_limits.append(len(self.trail))
+                self.assign(variable if self.phase[variable] else -variable, None)
+                return True
+        return False
+
+    def solve(self):
+        """Procura um modelo para as cláusulas. Devolve uma lista com o valor
+        (True ou False) de cada variável, indexada pela variável, ou None se
+        as cláusulas forem impossíveis de satisfazer."""
+        if self.unsatisfiable:
+            return None
+        self.backtrack(0)
+        if self.propagate() is not None:
+            self.unsatisfiable = True
+            return None
+
+        restarts = 0
+        limit = self.restart_unit * luby(restarts)
+        conflicts = 0
+
+        while True:
+            conflict = self.propagate()
+            if conflict is not None:
+                self.conflicts += 1
+                conflicts += 1
+                if not self.trail_limits:
+                    self.unsatisfiable = True
+                    return None
+
+                learnt, backjump = self.analyze(conflict)
+                self.backtrack(backjump)
+                if len(learnt) == 1:
+                    self.assign(learnt[0], None)
+                else:
+                    self.assign(learnt[0], self.attach(learnt))
+                self.activity_inc /= self.activity_decay
+
+            elif conflicts >= limit:
+                restarts += 1
+                limit = self.restart_unit * luby(restarts)
+                conflicts = 0
+                self.backtrack(0)
+
+            elif not self.decide():
+                return [value == 1 for value in self.values]
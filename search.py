@@ -65,7 +65,19 @@ class Problem:
 # ______________________________________________________________________________
 
 
-class Node:
+class Registered:
+    """Base of the classes whose live instances a memory.MemoryReport can
+    count: while it counts them, registry is the set of live instances and
+    each constructor adds the new instance with register."""
+
+    registry = None
+
+    def register(self):
+        if self.registry is not None:
+            self.registry.add(self)
+
+
+class Node(Registered):
     """A node in a search tree. Contains a pointer to the parent (the node
     that this is a successor of) and to the actual state for this node. Note
     that if a state is arrived at by two paths, then there are two nodes with
@@ -84,6 +96,7 @@ class Node:
         self.depth = 0
         if parent:
             self.depth = parent.depth + 1
+        self.register()
 
     def __repr__(self):
         return "<Node {}>".format(self.state)
@@ -0,0 +1,294 @@
+"""Serviço residente que resolve tabuleiros de PipeMania recebidos por um
+socket Unix, com as procuras a correr numa pool de processos.
+
+Por exemplo:
+    $ python3 server.py serve --socket /tmp/pipemania.sock &
+    $ python3 server.py send --socket /tmp/pipemania.sock < test-01.txt
+
+Protocolo: cada pedido é um tabuleiro no formato habitual (peças separadas
+por tabs), terminado por uma linha vazia. A resposta é o tabuleiro
+resolvido, ou uma linha "ERROR <motivo>", seguida de uma linha vazia. O
+pedido "STATUS" devolve uma linha JSON com o estado do serviço, incluindo
+o número de pedidos em fila. Uma ligação pode fazer vários pedidos
+seguidos.
+
+Os pedidos esperam numa fila do serviço até haver um processo livre na
+pool. Se o cliente fechar a ligação antes da resposta, o pedido é
+cancelado: sai da fila ou, se já estiver a ser resolvido, a resposta é
+descartada. O tempo limite de cada pedido conta desde que é recebido,
+incluindo o tempo passado na fila.
+"""
+
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import os
+import signal
+import sys
+import time
+
+import pipe
+
+
+class SolveTimeout(Exception):
+    pass
+
+
+def raise_timeout(signum, frame):
+    raise SolveTimeout()
+
+
+def init_worker():
+    """Prepara um processo da pool: os pedidos são interrompidos pelo
+    alarme de solve_request. O processo herda do serviço o tratamento do
+    SIGTERM pelo ciclo de eventos, que é reposto para que a morte de um
+    processo da pool não termine o serviço."""
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.set_wakeup_fd(-1)
+    signal.signal(signal.SIGALRM, raise_timeout)
+
+
+def solve_request(text: str, engine: str, timeout: float) -> str:
+    """Resolve o tabuleiro recebido e devolve a resposta a enviar. Corre
+    num processo da pool, onde as tabelas de pipe ficam carregadas entre
+    pedidos."""
+    if timeout:
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        board = pipe.Board.parse_lines(text.splitlines())
+        solution = pipe.solve(board, engine)
+    except SolveTimeout:
+        return "ERROR timeout"
+    except Exception as error:
+        return f"ERROR {error!r}"
+    finally:
+        if timeout:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+    return "ERROR unsolvable" if solution is None else str(solution)
+
+
+class SolveService:
+    """Aceita ligações no socket Unix e envia cada pedido para a pool."""
+
+    def __init__(self, workers: int, engine: str = "cbj", timeout: float = 60.0):
+        self.workers = workers
+        self.engine = engine
+        self.timeout = timeout
+        self.pool = self.new_pool()
+        # Requests are only handed to the pool when a worker is free, so
+        # that the ones still waiting can be cancelled
+        self.free_workers = asyncio.Semaphore(workers)
+        self.started = time.monotonic()
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+
+    def new_pool(self) -> concurrent.futures.ProcessPoolExecutor:
+        return concurrent.futures.ProcessPoolExecutor(self.workers, initializer=init_worker)
+
+    def restart_pool(self, broken: concurrent.futures.ProcessPoolExecutor):
+        """Substitui a pool, se ainda for a pool dada, que deixou de
+        funcionar porque um dos seus processos morreu."""
+        if self.pool is broken:
+            print("a pool worker died, restarting the pool", file=sys.stderr, flush=True)
+            self.pool = self.new_pool()
+            broken.shutdown(wait=False, cancel_futures=True)
+
+    def status(self) -> dict:
+        """Devolve o estado do serviço."""
+        return {
+            "workers": self.workers,
+            "in_flight": self.in_flight,
+            "queue_depth": max(0, self.in_flight - self.workers),
+            "completed": self.completed,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+            "uptime": round(time.monotonic() - self.started, 3),
+        }
+
+    async def run(self, text: str, deadline: float) -> str:
+        """Espera por um processo livre e resolve nele o tabuleiro, no
+        tempo que falta até deadline (ou sem limite, se for None)."""
+        try:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            await asyncio.wait_for(self.free_workers.acquire(), remaining)
+        except asyncio.TimeoutError:
+            return "ERROR timeout"
+        remaining = 0 if deadline is None else deadline - time.monotonic()
+        if deadline is not None and remaining <= 0:
+            self.free_workers.release()
+            return "ERROR timeout"
+
+        loop = asyncio.get_running_loop()
+        # A task that already started can't be cancelled, so the worker
+        # enforces the time limit itself and keeps its slot until it ends
+        pool = self.pool
+        try:
+            try:
+                future = pool.submit(solve_request, text, self.engine, remaining)
+            except concurrent.futures.process.BrokenProcessPool:
+                # A worker died while the pool was idle: this request isn't
+                # to blame, so it goes to the new pool
+                self.restart_pool(pool)
+                pool = self.pool
+                future = pool.submit(solve_request, text, self.engine, remaining)
+        except BaseException:
+            self.free_workers.release()
+            raise
+        future.add_done_callback(
+            lambda _: loop.call_soon_threadsafe(self.free_workers.release))
+        try:
+            return await asyncio.wrap_future(future)
+        except concurrent.futures.process.BrokenProcessPool:
+            self.restart_pool(pool)
+            raise
+
+    async def solve(self, text: str, disconnected: asyncio.Event):
+        """Resolve o tabuleiro na pool. Devolve a resposta, ou None se o
+        cliente desligar antes dela."""
+        deadline = time.monotonic() + self.timeout if self.timeout else None
+        self.in_flight += 1
+        solving = asyncio.ensure_future(self.run(text, deadline))
+        watching = asyncio.ensure_future(disconnected.wait())
+        try:
+            await asyncio.wait((solving, watching), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            self.in_flight -= 1
+            watching.cancel()
+            if not solving.done():
+                solving.cancel()
+                self.cancelled += 1
+                solving = None
+        if solving is None:
+            return None
+
+        try:
+            answer = solving.result()
+        except Exception as error:
+            answer = f"ERROR {error!r}"
+        if answer.startswith("ERROR"):
+            self.failed += 1
+        else:
+            self.completed += 1
+        return answer
+
+    async def read_requests(self, reader: asyncio.StreamReader, requests: asyncio.Queue,
+                            disconnected: asyncio.Event):
+        """Lê os pedidos da ligação para requests, enquanto os anteriores
+        são resolvidos, e assinala disconnected quando ela for fechada."""
+        try:
+            lines = []
+            while True:
+                line = await reader.readline()
+                if not line:
+                    # A request cut short by the end of the connection is dropped
+                    break
+                if line.strip():
+                    lines.append(line.decode())
+                    continue
+                await requests.put("".join(lines))
+                lines = []
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            disconnected.set()
+            await requests.put(None)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Atende os pedidos de uma ligação até ela ser fechada."""
+        requests = asyncio.Queue()
+        disconnected = asyncio.Event()
+        reading = asyncio.ensure_future(self.read_requests(reader, requests, disconnected))
+        try:
+            while True:
+                text = await requests.get()
+                if text is None:
+                    break
+                if not text:
+                    answer = "ERROR empty request"
+                elif text.strip() == "STATUS":
+                    answer = json.dumps(self.status())
+                else:
+                    answer = await self.solve(text, disconnected)
+                    if answer is None:
+                        break
+                writer.write(f"{answer}\n\n".encode())
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            reading.cancel()
+            writer.close()
+
+    async def serve(self, path: str):
+        if os.path.exists(path):
+            os.unlink(path)
+        server = await asyncio.start_unix_server(self.handle, path=path)
+        # Start the workers now so that the first request doesn't pay for it
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self.pool, pipe.Board.parse_lines, ["VB\tVE", "VC\tVD"])
+                               for _ in range(self.workers)))
+        # After the warm-up, so that the workers don't inherit the handler
+        # (init_worker also resets it in workers started later)
+        loop.add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+        print(f"listening on {path}", file=sys.stderr, flush=True)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.pool.shutdown(cancel_futures=True)
+            if os.path.exists(path):
+                os.unlink(path)
+
+
+async def send(path: str, text: str) -> str:
+    """Envia um pedido ao serviço e devolve a resposta."""
+    reader, writer = await asyncio.open_unix_connection(path)
+    request = text.rstrip("\n")
+    writer.write(request.encode() + (b"\n\n" if request else b"\n"))
+    await writer.drain()
+    lines = []
+    while True:
+        line = await reader.readline()
+        if not line or not line.strip():
+            break
+        lines.append(line.decode())
+    writer.close()
+    await writer.wait_closed()
+    return "".join(lines).rstrip("\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serviço de resolução de PipeMania num socket Unix.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = commands.add_parser("serve", help="inicia o serviço")
+    serve_parser.add_argument("--socket", default="/tmp/pipemania.sock")
+    serve_parser.add_argument("--workers", type=int, default=os.cpu_count())
+    serve_parser.add_argument("--engine", choices=pipe.engines, default="cbj")
+    serve_parser.add_argument("--timeout", type=float, default=60.0,
+                              help="tempo limite de cada pedido, em segundos (0 para nenhum)")
+
+    send_parser = commands.add_parser("send", help="envia o tabuleiro do stdin ao serviço")
+    send_parser.add_argument("--socket", default="/tmp/pipemania.sock")
+    send_parser.add_argument("--status", action="store_true",
+                             help="pede o estado do serviço em vez de enviar um tabuleiro")
+
+    args = parser.parse_args(argv)
+    if args.command == "serve":
+        service = SolveService(args.workers, args.engine, args.timeout)
+        try:
+            asyncio.run(service.serve(args.socket))
+        except (KeyboardInterrupt, asyncio.CancelledError):
+            pass
+        return 0
+
+    answer = asyncio.run(send(args.socket, "STATUS" if args.status else sys.stdin.read()))
+    print(answer)
+    return 1 if answer.startswith("ERROR") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,74 @@
+"""Tabuleiros de um lote num segmento de memória partilhada, para os
+processos de uma pool os lerem sem os receberem por pickle.
+
+Cada tabuleiro ocupa um byte por célula, com a máscara da peça (ver
+Board.read_cells), a partir do seu deslocamento no segmento. Os processos
+recebem apenas o nome do segmento, uma vez, e por tabuleiro o par
+(deslocamento, tamanho). Quem resolve um tabuleiro escreve as peças da
+solução no mesmo sítio, por cima das peças lidas.
+"""
+
+from multiprocessing import shared_memory
+
+from pipe import Board
+
+
+class SharedBoards:
+    """Um segmento de memória partilhada com vários tabuleiros."""
+
+    def __init__(self, memory: shared_memory.SharedMemory):
+        self.memory = memory
+
+    @property
+    def name(self) -> str:
+        return self.memory.name
+
+    @classmethod
+    def create(cls, boards) -> tuple:
+        """Cria um segmento com os tabuleiros dados, como pares (máscaras,
+        tamanho). Devolve o segmento e o lugar, (deslocamento, tamanho), de
+        cada tabuleiro."""
+        boards = list(boards)
+        # A segment can't be empty
+        memory = shared_memory.SharedMemory(create=True,
+                                            size=max(1, sum(len(cells) for cells, _ in boards)))
+        slots = []
+        offset = 0
+        for cells, size in boards:
+            memory.buf[offset:offset + len(cells)] = cells
+            slots.append((offset, size))
+            offset += len(cells)
+        return cls(memory), slots
+
+    @classmethod
+    def attach(cls, name: str) -> 'SharedBoards':
+        """Abre um segmento criado por create noutro processo."""
+        return cls(shared_memory.SharedMemory(name))
+
+    def cells(self, slot: tuple) -> memoryview:
+        """Devolve uma vista, sem cópia, das máscaras do tabuleiro. A vista
+        tem de ser libertada (release) antes de close."""
+        offset, size = slot
+        return self.memory.buf[offset:offset + size * size]
+
+    def read(self, slot: tuple, stats=None) -> Board:
+        """Cria o tabuleiro guardado no lugar dado."""
+        with self.cells(slot) as cells:
+            return Board.from_cells(cells, slot[1], stats)
+
+    def write(self, slot: tuple, board: Board):
+        """Escreve as peças do tabuleiro no lugar dado."""
+        with self.cells(slot) as cells:
+            cells[:] = board.cells
+
+    def format(self, slot: tuple) -> str:
+        """Devolve o tabuleiro guardado no lugar dado no formato do stdin."""
+        with self.cells(slot) as cells:
+            return Board.format_cells(cells, slot[1])
+
+    def close(self):
+        self.memory.close()
+
+    def unlink(self):
+        """Remove o segmento. Só o processo que o criou o deve fazer."""
+        self.memory.unlink()
@@ -5,13 +5,33 @@ import collections
 import collections.abc
 import functools
 import heapq
+import importlib
 import operator
 import os.path
 import random
 from itertools import chain, combinations
 from statistics import mean
 
-import numpy as np
+
+class LazyModule:
+    """Stands for the named module without importing it: the module is only
+    imported, and only looked for, when one of its attributes is first
+    used, so a missing module is only an error for the code that needs
+    it."""
+
+    def __init__(self, name):
+        self.__name = name
+
+    def __getattr__(self, attribute):
+        return getattr(importlib.import_module(self.__name), attribute)
+
+    def __repr__(self):
+        return f"<lazy module {self.__name!r}>"
+
+
+# numpy takes longer to import than most searches take to run, and the
+# searches only need it for a few helpers
+np = LazyModule("numpy")
 
 
 # ______________________________________________________________________________